@@ -7,49 +7,67 @@
 import streamlit as st
 from rag_pipeline import RAGPipeline  # Import your RAG pipeline
 import pandas as pd
-from supabase import create_client, Client
+from postgrest.exceptions import APIError
+from db import get_supabase, new_supabase_client
 import os
 from dotenv import load_dotenv
 import pandas as pd
-from datetime import datetime
 import tempfile
 import logging  # Added for logging
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+import queue
+import threading
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rows shown in the admin panel's user picker; narrow further with the search box
+USERS_PAGE_SIZE = 50
+
+# Feedback rows sent per insert by the feedback drain thread
+FEEDBACK_BATCH_SIZE = 50
+# Inserts tried per feedback row before it is dropped, and the pause before a retry (seconds)
+FEEDBACK_MAX_ATTEMPTS = 3
+FEEDBACK_RETRY_DELAY = 5
+
+# Uploads are copied to disk in chunks of this size (bytes)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client and store in session state
-def init_supabase():
+# Initialize Supabase client: one per browser session, kept in st.session_state so the
+# signed-in user's JWT never leaks into another session. Streamlit re-executes this script
+# per run, so `supabase` below is this session's client, and a cached function runs its
+# query with the client of whichever session missed the cache. Its result is then served to
+# every session, so st.cache_data is only safe for reads that are public (courses, filter
+# options) or keyed by the user they're scoped to (user_id); an RLS-dependent read needs
+# the user in its arguments. Process-wide objects such as the RAG pipeline use the
+# anonymous get_supabase() instead. The client's connections are closed once the session
+# state that holds it is dropped (see db.new_supabase_client).
+try:
     if 'supabase' not in st.session_state:
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_KEY")
-        if not url or not key:
-            st.error("Supabase credentials not found in environment variables")
-            return None
-        st.session_state.supabase = create_client(url, key)
-    return st.session_state.supabase
-
-# Initialize Supabase client
-supabase = init_supabase()
-if not supabase:
-    st.error("Supabase connection failed")
+        st.session_state.supabase = new_supabase_client()
+except ValueError:
+    st.error("Supabase credentials not found in environment variables")
     st.stop()
+supabase = st.session_state.supabase
 
-# Reapply session on every rerun if the user is signed in
-if 'auth' in st.session_state and st.session_state.auth.get('access_token'):
-    try:
-        supabase.auth.set_session(
-            access_token=st.session_state.auth['access_token'],
-            refresh_token=st.session_state.auth['refresh_token']
-        )
-        current_user = supabase.auth.get_user()
-        logger.info(f"Current authenticated user: {current_user.user.email if current_user.user else 'None'}")
-    except Exception as e:
-        st.error(f"Failed to reapply session: {str(e)}")
+# Process-wide pool for writes whose result the UI doesn't wait on. Cached so the
+# pool survives reruns (Streamlit re-executes this script on every interaction).
+@st.cache_resource(show_spinner=False)
+def get_background_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="supabase-bg")
+
+def run_in_background(description, fn, *args, **kwargs):
+    """Fire-and-forget `fn`; failures are logged since there is no script run to report to."""
+    def log_failure(future):
+        if future.exception():
+            logger.error(f"Background {description} failed: {str(future.exception())}")
+    get_background_executor().submit(fn, *args, **kwargs).add_done_callback(log_failure)
 
 # Session state management
 def init_session_state():
@@ -65,29 +83,11 @@ def init_session_state():
 
 init_session_state()
 
-# Test Supabase connection
-response = supabase.table("courses").select("*").limit(5).execute()
-logger.info(f"Initial Supabase test query response: {response.data}")
-
 def check_admin_status():
+    # Role is loaded with the profile in handle_sign_in; sign-out clears session state
     if not st.session_state.auth.get('user'):
-        st.write("Debug: No user in session state")
-        return False
-    user_email = st.session_state.auth['user'].email
-    user_id = st.session_state.auth['user'].id
-    # st.write(f"Debug: User email: {user_email}, User ID: {user_id}")
-    try:
-        user_data = supabase.table("users").select("role").eq("email", user_email).execute()
-        # st.write(f"Debug: Supabase response: {user_data.data}")
-        if not user_data.data:
-            st.write("Debug: No user data found in Supabase for this email")
-            return False
-        role = user_data.data[0].get("role")
-        st.write(f"Debug: User role: {role}")
-        return role == "admin"
-    except Exception as e:
-        st.write(f"Debug: Supabase query error: {str(e)}")
         return False
+    return (st.session_state.auth.get('user_data') or {}).get('role') == 'admin'
 
 # Authentication Functions
 def handle_sign_up(email, password, full_name=None):
@@ -105,21 +105,9 @@ def handle_sign_up(email, password, full_name=None):
         if not auth_response.user:
             st.error("User creation failed")
             return False
-            
-        profile_data = {
-            "id": auth_response.user.id,
-            "email": email,
-            "full_name": full_name or email.split('@')[0],
-            "created_at": datetime.now().isoformat(),
-            "role": "user"
-        }
-        
-        profile_response = supabase.table("users").insert(profile_data).execute()
         
-        if not profile_response.data:
-            st.error("Profile creation failed")
-            return False
-            
+        # The public.users profile is created in the same transaction by the
+        # on_auth_user_created trigger (schema.sql)
         return True
         
     except Exception as e:
@@ -142,41 +130,30 @@ def handle_sign_in(email, password):
         user_id = auth_response.user.id
         logger.info(f"User signed in successfully, user_id: {user_id}")
         
-        # Check if user exists in the users table
-        user_data_response = supabase.table("users") \
-            .select("*") \
-            .eq("id", user_id) \
-            .execute()
-        
-        user_metadata = auth_response.user.user_metadata if auth_response.user.user_metadata else {}
-        if user_data_response.data:
-            user_data = user_data_response.data[0]
-            logger.info(f"User found in users table: {user_data}")
-        else:
-            # User not found in users table, create a new profile
-            logger.info(f"User not found in users table, creating profile for user_id: {user_id}")
-            user_data = {
-                "id": user_id,
-                "email": email,
-                "full_name": user_metadata.get('full_name', email.split('@')[0]),
-                "created_at": datetime.now().isoformat(),
-                "role": "user",  # Default role
-                "last_login": datetime.now().isoformat()
-                # Do not include password_hash since it's not needed
-            }
-            try:
-                insert_response = supabase.table("users").insert(user_data).execute()
-                if insert_response.data:
-                    logger.info(f"Successfully created user profile: {insert_response.data}")
-                    user_data = insert_response.data[0]
-                else:
+        # Stamp last_login server-side and get the profile back in one round-trip;
+        # only a first sign-in without a profile row needs the extra insert.
+        try:
+            touch_response = supabase.rpc("touch_last_login", {"uid": user_id}).execute()
+            if touch_response.data:
+                user_data = touch_response.data[0]
+                logger.info(f"User found in users table: {user_data}")
+            else:
+                logger.info(f"User not found in users table, creating profile for user_id: {user_id}")
+                user_metadata = auth_response.user.user_metadata if auth_response.user.user_metadata else {}
+                insert_response = supabase.table("users").insert({
+                    "id": user_id,
+                    "email": email,
+                    "full_name": user_metadata.get('full_name', email.split('@')[0])
+                }).execute()
+                if not insert_response.data:
                     logger.error(f"Failed to create user profile, response: {insert_response}")
                     st.error("Failed to create user profile in database")
                     return False
-            except Exception as e:
-                logger.error(f"Error creating user profile: {str(e)}")
-                st.error(f"Error creating user profile: {str(e)}")
-                return False
+                user_data = insert_response.data[0]
+        except Exception as e:
+            logger.error(f"Error loading user profile: {str(e)}")
+            st.error(f"Error loading user profile: {str(e)}")
+            return False
         
         st.session_state.auth = {
             'access_token': auth_response.session.access_token,
@@ -185,19 +162,7 @@ def handle_sign_in(email, password):
             'user_data': user_data
         }
         
-        supabase.auth.set_session(
-            access_token=auth_response.session.access_token,
-            refresh_token=auth_response.session.refresh_token
-        )
-        
-        try:
-            update_response = supabase.table("users").update({
-                "last_login": datetime.now().isoformat()
-            }).eq("id", user_id).execute()
-            logger.info(f"Updated last_login for user_id: {user_id}, response: {update_response.data}")
-        except Exception as e:
-            logger.error(f"Error updating last_login: {str(e)}")
-        
+        # sign_in_with_password already stored the session on this session's client
         logger.info("Sign-in completed successfully")
         return True
         
@@ -215,22 +180,64 @@ def handle_sign_out():
         st.error(f"Sign out error: {str(e)}")
 
 # Course Functions
-def get_all_courses(page=1, page_size=10):
-    try:
-        offset = (page - 1) * page_size
-        logger.info(f"Fetching courses: page={page}, page_size={page_size}, offset={offset}")
-        response = supabase.table("courses")\
-            .select("*")\
-            .range(offset, offset + page_size - 1)\
-            .execute()
-        logger.info(f"Supabase response: {response}")
-        courses = response.data if response.data else []
-        logger.info(f"Retrieved {len(courses)} courses")
-        return courses
-    except Exception as e:
-        logger.error(f"Error loading courses: {str(e)}")
-        st.error(f"Error loading courses: {str(e)}")
-        return []
+# Columns the course listings render; avoids shipping unused columns on every fetch
+COURSE_COLUMNS = "course_id, title, subject, level, duration, description, subscribers, url"
+
+def normalize_course(row):
+    """Canonical course row: lower-case `subject` (defaulting to 'General') and `course_id`."""
+    subject = row.get('subject') or row.get('Subject') or row.get('SUBJECT')
+    row['subject'] = subject.strip() if isinstance(subject, str) and subject.strip() else 'General'
+    row['course_id'] = row.get('course_id') or row.get('id')
+    return row
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_all_courses(cursor=None, page_size=10, subject=None, level=None):
+    """Fetch one page of courses after `cursor` (keyset pagination on course_id).
+
+    `subject`/`level` are applied as server-side filters when given.
+
+    Returns (courses, next_cursor); next_cursor is None when the page is empty. Errors
+    propagate to the caller, so a failed fetch is never cached.
+    """
+    logger.info(f"Fetching courses: cursor={cursor}, page_size={page_size}, subject={subject}, level={level}")
+    query = supabase.table("courses").select(COURSE_COLUMNS)
+    if subject:
+        query = query.eq("subject", subject)
+    if level:
+        query = query.eq("level", level)
+    if cursor is not None:
+        query = query.gt("course_id", cursor)
+    query = query.order("course_id").limit(page_size)
+    response = query.execute()
+    courses = [normalize_course(c) for c in response.data] if response.data else []
+    logger.info(f"Retrieved {len(courses)} courses")
+    next_cursor = courses[-1]["course_id"] if courses else None
+    return courses, next_cursor
+
+@st.cache_data(ttl=600, show_spinner=False)
+def list_distinct_subjects():
+    """All subjects in the catalog, for the filter dropdown; cleared when courses change.
+
+    SELECT DISTINCT runs server-side (see schema.sql), so the result isn't cut off by
+    PostgREST's max-rows like a plain column select. Errors propagate and aren't cached.
+    """
+    rows = supabase.rpc("list_course_subjects", {}).execute().data or []
+    return [r['subject'] for r in rows]
+
+@st.cache_data(ttl=600, show_spinner=False)
+def list_distinct_levels():
+    """All levels in the catalog, for the filter dropdown; see list_distinct_subjects."""
+    rows = supabase.rpc("list_course_levels", {}).execute().data or []
+    return [r['level'] for r in rows]
+
+def clear_course_caches():
+    """Invalidate every cached read derived from the courses table."""
+    get_all_courses.clear()
+    get_user_courses.clear()
+    get_dashboard_bundle.clear()
+    build_course_context.clear()
+    list_distinct_subjects.clear()
+    list_distinct_levels.clear()
 
 def add_course_page():
     st.subheader("📝 Add New Course")
@@ -261,24 +268,60 @@ def add_course_page():
                     }
                     response = supabase.table("courses").insert(course_data).execute()
                     if response.data:
+                        clear_course_caches()
                         st.success(f"Course '{course_title}' added successfully!")
                     else:
                         st.error("Failed to add course")
                 except Exception as e:
                     st.error(f"Failed to add course: {str(e)}")
 
+@st.cache_data(ttl=60, show_spinner=False)
 def get_user_courses(user_id):
-    try:
-        res = supabase.table("user_courses")\
-            .select("*, courses!inner(*)")\
-            .eq("user_id", user_id)\
-            .execute()
-        return res.data if res.data else []
-    except Exception as e:
-        st.error(f"Error fetching user courses: {str(e)}")
-        return []
+    """The user's enrollments with their courses; errors propagate so they aren't cached."""
+    res = supabase.table("user_courses")\
+        .select(f"progress, courses!inner({COURSE_COLUMNS})")\
+        .eq("user_id", user_id)\
+        .execute()
+    enrollments = res.data if res.data else []
+    for enrollment in enrollments:
+        normalize_course(enrollment['courses'])
+    return enrollments
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_dashboard_bundle(user_id):
+    """Role, enrolled courses and recently added courses in one RPC (see schema.sql).
+
+    Errors propagate to the caller, so a failed load is never cached.
+    """
+    bundle = supabase.rpc("get_dashboard_bundle", {"uid": user_id}).execute().data
+    bundle = bundle or {"role": None, "enrolled": [], "avg_progress": 0, "recent": []}
+    for enrollment in bundle['enrolled']:
+        normalize_course(enrollment['courses'])
+    return bundle
+
+@st.cache_data(ttl=300, show_spinner=False)
+def build_course_context(user_id):
+    """Enrolled courses rendered for the assistant prompt; cleared on enrollment.
+
+    Ordered by course_id and stripped so the string is byte-identical between calls,
+    which keeps the LLM's cached prompt prefix valid.
+    """
+    res = supabase.table("user_courses")\
+        .select("course_id, courses!inner(title, subject, description)")\
+        .eq("user_id", user_id)\
+        .order("course_id")\
+        .execute()
+    if not res.data:
+        return "The user has not enrolled in any courses yet."
+    return "\n".join([
+        f"Course: {course['courses']['title']}\n"
+        f"Subject: {course['courses']['subject']}\n"
+        f"Description: {(course['courses']['description'] or '').strip()}"
+        for course in res.data
+    ])
 
 def handle_enroll_course(course_id):
+    """Enroll the signed-in user; returns True once they are enrolled (new or existing)."""
     try:
         if not st.session_state.get('auth') or not st.session_state.auth.get('user'):
             st.warning("Please sign in to enroll")
@@ -292,31 +335,44 @@ def handle_enroll_course(course_id):
             st.error(f"Invalid course ID: {course_id}. Must be an integer.")
             return
         
-        existing = supabase.table("user_courses")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .eq("course_id", course_id_int)\
-            .execute()
-        
-        if existing.data:
-            st.warning("You're already enrolled in this course")
-            return
-        
-        response = supabase.table("user_courses").insert({
-            "user_id": user_id,
-            "course_id": course_id_int,
-            "progress": 0
-        }).execute()
+        # The UNIQUE (user_id, course_id) constraint rejects duplicates, so no pre-check
+        try:
+            response = supabase.table("user_courses").insert({
+                "user_id": user_id,
+                "course_id": course_id_int,
+                "progress": 0
+            }).execute()
+        except APIError as e:
+            if e.code == "23505":  # unique_violation
+                st.session_state.enrolled_course_ids.add(course_id_int)
+                st.toast("You're already enrolled in this course")
+                return True
+            raise
         
         if response.data:
-            st.success("Successfully enrolled!")
-            st.rerun()
+            # The caller reruns the enroll fragment to redraw it from enrolled_course_ids
+            # (hence st.toast, which survives that rerun); other pages pick the
+            # enrollment up from the cleared caches.
+            st.session_state.enrolled_course_ids.add(course_id_int)
+            get_user_courses.clear()
+            get_dashboard_bundle.clear()
+            build_course_context.clear()
+            st.toast("Successfully enrolled!")
+            return True
         else:
             st.error("Enrollment failed")
     except Exception as e:
         st.error(f"Enrollment error: {str(e)}")
 
 # Admin Functions
+@st.cache_data(ttl=60, show_spinner=False)
+def list_users(search=""):
+    """First USERS_PAGE_SIZE users whose email matches `search`; cleared when an admin adds or deletes a user."""
+    query = supabase.table("users").select("id, email, full_name, role")
+    if search:
+        query = query.ilike("email", f"%{search}%")
+    return query.order("email").range(0, USERS_PAGE_SIZE - 1).execute().data
+
 def admin_add_user(email, password, full_name, role="user"):
     try:
         if st.session_state.auth['user_data'].get('role') != 'admin':
@@ -340,16 +396,17 @@ def admin_add_user(email, password, full_name, role="user"):
             "id": auth_response.user.id,
             "email": email,
             "full_name": full_name,
-            "created_at": datetime.now().isoformat(),
             "role": role
         }
         
-        profile_response = supabase.table("users").insert(profile_data).execute()
+        # Upsert: on_auth_user_created has already inserted the row with the default role
+        profile_response = supabase.table("users").upsert(profile_data).execute()
         
         if not profile_response.data:
             st.error("Profile creation failed")
             return False
         
+        list_users.clear()
         st.success(f"User {email} added successfully!")
         return True
         
@@ -363,12 +420,10 @@ def admin_delete_user(user_id):
             st.error("Only admins can delete users")
             return False
         
-        supabase.auth.admin.delete_user(user_id)
-        
-        supabase.table("users").delete().eq("id", user_id).execute()
-        
-        supabase.table("user_courses").delete().eq("user_id", user_id).execute()
+        # Deletes enrollments, profile and auth user in one transaction (see schema.sql)
+        supabase.rpc("delete_user_cascade", {"uid": user_id}).execute()
         
+        list_users.clear()
         st.success("User deleted successfully!")
         return True
         
@@ -388,9 +443,9 @@ def admin_delete_course(course_id):
             st.error(f"Invalid course ID: {course_id}")
             return False
         
-        supabase.table("courses").delete().eq("course_id", course_id_int).execute()
-        
-        supabase.table("user_courses").delete().eq("course_id", course_id_int).execute()
+        # Deletes enrollments and the course in one transaction (see schema.sql)
+        supabase.rpc("delete_course_cascade", {"cid": course_id_int}).execute()
+        clear_course_caches()
         
         st.success("Course deleted successfully!")
         return True
@@ -399,30 +454,158 @@ def admin_delete_course(course_id):
         st.error(f"Error deleting course: {str(e)}")
         return False
 
+@st.cache_resource(show_spinner="Loading Learning Assistant...")
+def get_rag_pipeline() -> RAGPipeline:
+    # Embedding model and agents are loaded once per process and shared by every session;
+    # a failed load isn't cached, so the next run retries
+    rag_pipeline = RAGPipeline(supabase_client=get_supabase())
+    rag_pipeline.setup_agents()
+    return rag_pipeline
+
+@st.cache_resource(show_spinner=False)
+def warm_rag_pipeline():
+    # Starts loading the pipeline once per process, off the script thread, so the first
+    # Chat Assistant or Dashboard visit finds it ready. If the load fails, the next
+    # get_rag_pipeline() call retries it and reports the error.
+    return get_background_executor().submit(get_rag_pipeline)
+
+warm_rag_pipeline()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def answer_question(question, user_id, enrolled_context):
+    """Memoized assistant answer, so reruns from the feedback widgets don't call the LLM again.
+
+    Uses RAGPipeline.answer, which raises on failure, so error messages are never cached.
+    """
+    return get_rag_pipeline().answer(question, user_id=user_id, enrolled_context=enrolled_context)
+
+@st.cache_resource
+def get_ingest_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest")
+
+def ingest_file(rag_pipeline, documents, user_id, tmp_file_path=None):
+    """Embed an uploaded file's documents; runs on the ingest executor. Returns (success, preview_docs).
+
+    `documents` may be a lazy loader iterator. The temp file it reads from, if any, is
+    removed here once ingestion ends.
+    """
+    preview_docs = []
+    def stream():
+        # Pages are streamed into add_documents; only the first is kept for the preview
+        for doc in documents:
+            if not preview_docs:
+                preview_docs.append(doc)
+            yield doc
+    try:
+        return rag_pipeline.add_documents(stream(), user_id), preview_docs
+    finally:
+        if tmp_file_path:
+            os.unlink(tmp_file_path)
+
+@st.fragment(run_every=2)
+def show_ingest_progress(file_id, file_name):
+    # Polls the ingest job; a full rerun renders the result once it finishes
+    if st.session_state.ingest_jobs[file_id].done():
+        st.rerun()
+    st.info(f"Processing '{file_name}'... you can keep using the app meanwhile.")
+
+def submit_feedback(user_id, query, response, feedback_text):
+    row = {
+        "user_id": user_id,
+        "query": query[:500],
+        "response": response[:2000],
+        "feedback": feedback_text
+    }
+    # Queued with this session's client: RLS checks the insert against the submitting user
+    client = supabase
+    try:
+        get_feedback_queue().put_nowait((client, row, 1))
+    except queue.Full:
+        run_in_background("feedback insert", lambda: client.table("feedback").insert(row).execute())
+
+@st.cache_resource(show_spinner=False)
+def get_feedback_queue() -> queue.Queue:
+    # One queue and drain thread per process, shared by every session
+    feedback_queue = queue.Queue(maxsize=1000)
+    threading.Thread(target=drain_feedback, args=(feedback_queue,), name="feedback-drain", daemon=True).start()
+    return feedback_queue
+
+def drain_feedback(feedback_queue):
+    """Insert queued (client, row, attempt) items, up to FEEDBACK_BATCH_SIZE rows per round-trip.
+
+    Rows are grouped by the session client that queued them, so each insert carries
+    only its own user's rows and runs under that user's JWT. A failed batch is queued
+    again after FEEDBACK_RETRY_DELAY, up to FEEDBACK_MAX_ATTEMPTS tries per row.
+    """
+    while True:
+        items = [feedback_queue.get()]
+        while len(items) < FEEDBACK_BATCH_SIZE:
+            try:
+                items.append(feedback_queue.get_nowait())
+            except queue.Empty:
+                break
+        batches = {}
+        for client, row, attempt in items:
+            batches.setdefault((id(client), attempt), (client, attempt, []))[2].append(row)
+        failed = False
+        for client, attempt, rows in batches.values():
+            try:
+                client.table("feedback").insert(rows).execute()
+            except Exception as e:
+                failed = True
+                if attempt >= FEEDBACK_MAX_ATTEMPTS:
+                    logger.error(f"Feedback insert of {len(rows)} rows failed, dropping them: {str(e)}")
+                    continue
+                logger.warning(f"Feedback insert of {len(rows)} rows failed (attempt {attempt}), retrying: {str(e)}")
+                for row in rows:
+                    try:
+                        feedback_queue.put_nowait((client, row, attempt + 1))
+                    except queue.Full:
+                        logger.error("Feedback queue full, dropping a row that failed to insert")
+        if failed:
+            time.sleep(FEEDBACK_RETRY_DELAY)
+
 # UI Components
 def show_sidebar():
     with st.sidebar:
-        st.title("Learning Platform")
+        show_sidebar_nav()
+
+@st.fragment
+def show_sidebar_nav():
+    # Runs as a fragment: menu clicks rerun only this block until the page actually changes
+    st.title("Learning Platform")
+    
+    if st.session_state.auth.get('user'):
+        full_name = st.session_state.auth['user_data'].get('full_name', 'User')
+        st.write(f"Welcome, {full_name}")
         
-        if st.session_state.auth.get('user'):
-            full_name = st.session_state.auth['user_data'].get('full_name', 'User')
-            st.write(f"Welcome, {full_name}")
-            
+        if 'nav_pages' not in st.session_state:
             pages = ["Dashboard", "View Courses", "My Courses", "Chat Assistant"]
             if check_admin_status():
                 pages.append("Admin Panel")
             else:
                 pages.append("Add Course")
-            st.session_state.page = st.radio("Menu", pages)
-            
-            if st.button("Sign Out"):
-                handle_sign_out()
-            
-            if st.button("Clear Session (Debug)"):
-                st.session_state.clear()
-                st.rerun()
-        else:
-            st.session_state.page = st.radio("Menu", ["Sign In", "Sign Up"])
+            st.session_state.nav_pages = pages
+        choice = st.radio("Menu", st.session_state.nav_pages)
+        
+        if st.button("Sign Out"):
+            handle_sign_out()
+        
+        if st.button("Clear Session (Debug)"):
+            # Signing out stops the client's token-refresh timer, which would otherwise
+            # keep the dropped client (and its connections) alive
+            try:
+                supabase.auth.sign_out()
+            except Exception as e:
+                logger.warning(f"Sign out during session clear failed: {str(e)}")
+            st.session_state.clear()
+            st.rerun()
+    else:
+        choice = st.radio("Menu", ["Sign In", "Sign Up"])
+    
+    if choice != st.session_state.page:
+        st.session_state.page = choice
+        st.rerun()
 
 def show_chat_assistant():
     st.title("Chat Assistant")
@@ -435,7 +618,12 @@ def show_chat_assistant():
     
     # Display available courses
     st.subheader("Available Courses")
-    courses = get_all_courses(page=1, page_size=5)
+    try:
+        courses, _ = get_all_courses(page_size=5)
+    except Exception as e:
+        logger.error(f"Error loading courses: {str(e)}")
+        st.error(f"Error loading courses: {str(e)}")
+        courses = []
     if courses:
         for course in courses:
             st.write(f"- **{course['title']}** ({course['subject']}, {course['level']})")
@@ -443,15 +631,12 @@ def show_chat_assistant():
         st.info("No courses available yet.")
     
     # Initialize RAG Pipeline
-    if 'rag_pipeline' not in st.session_state:
-        try:
-            st.session_state.rag_pipeline = RAGPipeline(supabase_client=supabase)
-            st.session_state.rag_pipeline.setup_agents()
-            st.success("Chat Assistant initialized successfully!")
-        except Exception as e:
-            logger.error(f"Failed to initialize Chat Assistant: {str(e)}")
-            st.error(f"Failed to initialize Chat Assistant: {str(e)}")
-            return
+    try:
+        get_rag_pipeline()
+    except Exception as e:
+        logger.error(f"Failed to initialize Chat Assistant: {str(e)}")
+        st.error(f"Failed to initialize Chat Assistant: {str(e)}")
+        return
 
     # Chat interface
     st.subheader("Talk to Your Learning Assistant")
@@ -464,17 +649,7 @@ def show_chat_assistant():
     if user_input:
         with st.spinner("Thinking..."):
             try:
-                user_courses = get_user_courses(user_id)
-                course_context = "\n".join([
-                    f"Course: {course['courses']['title']}\n"
-                    f"Subject: {course['courses']['subject']}\n"
-                    f"Description: {course['courses']['description']}"
-                    for course in user_courses
-                ]) if user_courses else "The user has not enrolled in any courses yet."
-                
-                full_query = f"User's enrolled courses:\n{course_context}\n\nQuestion: {user_input}"
-                
-                response = st.session_state.rag_pipeline.basic_rag_chain(full_query, user_id=user_id)
+                response = answer_question(user_input, user_id, build_course_context(user_id))
                 st.write(f"**Chat Assistant**: {response}")
                 
                 with st.expander("Provide Feedback"):
@@ -492,13 +667,7 @@ def show_chat_assistant():
                             if len(feedback_text) > 1000:
                                 st.error("Feedback is too long (max 1000 characters)")
                             else:
-                                supabase.table("feedback").insert({
-                                    "user_id": user_id,
-                                    "query": user_input[:500],
-                                    "response": response[:2000],
-                                    "feedback": feedback_text,
-                                    "created_at": datetime.now().isoformat()
-                                }).execute()
+                                submit_feedback(user_id, user_input, response, feedback_text)
                                 st.success("Thank you for your feedback!")
             except Exception as e:
                 logger.error(f"Error processing question: {str(e)}")
@@ -570,102 +739,167 @@ def show_add_course():
                         "duration": duration if duration else None,
                         "is_paid": is_paid,
                         "published": published,
-                        "subscribers": 0,
-                        "created_at": datetime.now().isoformat()
+                        "subscribers": 0
                     }
                     response = supabase.table("courses").insert(course_data).execute()
                     if response.data:
+                        clear_course_caches()
                         st.success(f"Course '{course_title}' added successfully!")
+                        return True
                     else:
                         st.error("Failed to add course: No data returned from Supabase")
                 except Exception as e:
                     st.error(f"Failed to add course: {str(e)}")
+    return False
+
+def show_course_table(courses, key, progress=None):
+    """Render courses as a single table; returns the index of the selected row, or None."""
+    rows = []
+    column_config = {}
+    if progress is not None:
+        column_config["Progress"] = st.column_config.ProgressColumn(
+            "Progress", min_value=0, max_value=100, format="%d%%"
+        )
+    for idx, course in enumerate(courses):
+        row = {
+            "Title": course.get('title', 'Untitled Course'),
+            "Subject": course['subject'],
+            "Level": course.get('level', 'N/A'),
+            "Duration": course.get('duration') or 'Not specified',
+            "Subscribers": course.get('subscribers', 0)
+        }
+        if progress is not None:
+            row["Progress"] = progress[idx]
+        rows.append(row)
+    event = st.dataframe(
+        pd.DataFrame(rows),
+        key=key,
+        on_select="rerun",
+        selection_mode="single-row",
+        hide_index=True,
+        use_container_width=True,
+        column_config=column_config
+    )
+    selected = [idx for idx in event.selection.rows if idx < len(courses)]
+    return selected[0] if selected else None
+
+def show_course_details(course, progress=None, enrollable=False):
+    """Detail card for the course selected in show_course_table."""
+    expander_label = f"{course.get('title', 'Untitled Course')} - {course.get('level', 'N/A')}"
+    with st.expander(expander_label, expanded=True):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.write(f"Duration: {course.get('duration') or 'Not specified'}")
+            st.caption(f"Subject: {course['subject']}")
+            st.write(course.get('description', 'No description available'))
+            if progress is not None:
+                st.progress(progress / 100.0)
+                st.write(f"Progress: {progress}%")
+        with col2:
+            st.metric("Subscribers", course.get('subscribers', 0))
+            if enrollable:
+                show_enroll_button(course['course_id'])
+
+        if course.get('url'):
+            st.markdown(f"[View Course]({course.get('url')})")
+
+@st.fragment
+def show_enroll_button(course_id):
+    # Clicking reruns only this fragment, not the whole course listing
+    try:
+        course_id_int = int(course_id)
+    except (TypeError, ValueError):
+        st.error("Cannot enroll: Course ID is missing.")
+        return
+    if course_id_int in st.session_state.enrolled_course_ids:
+        st.button("Enrolled ✓", key=f"enrolled_{course_id_int}", disabled=True)
+    elif st.button("Enroll", key=f"enroll_{course_id_int}"):
+        if handle_enroll_course(course_id_int):
+            st.rerun(scope="fragment")
 
 def show_view_courses():
     st.title("Available Courses")
-    
+
     try:
-        courses = get_all_courses()
+        subjects, levels = list_distinct_subjects(), list_distinct_levels()
     except Exception as e:
-        st.error(f"Failed to fetch courses: {str(e)}")
-        return
-    
-    if not courses:
-        st.info("No courses available yet.")
-        return
-    
-    raw_subjects = []
-    for course in courses:
-        subject = course.get('subject', course.get('Subject', course.get('SUBJECT', None)))
-        if subject is None or (isinstance(subject, str) and subject.strip() == ""):
-            subject = 'Missing'
-        raw_subjects.append(subject)
-    
-    unique_subjects = sorted({subject for subject in raw_subjects if subject != 'Missing'})
-    
-    items_per_page = 10
-    page_number = st.number_input(
-        "Page Number", min_value=1, value=1, step=1, key="course_page"
-    )
-    start_idx = (page_number - 1) * items_per_page
-    end_idx = start_idx + items_per_page
-    paginated_courses = courses[start_idx:end_idx]
-    
-    st.write(f"Showing courses {start_idx + 1} to {min(end_idx, len(courses))} of {len(courses)}")
-    
+        logger.error(f"Error loading course filters: {str(e)}")
+        st.error(f"Error loading course filters: {str(e)}")
+        subjects, levels = [], []
+
     col1, col2 = st.columns(2)
     with col1:
-        subjects = ["All"] + unique_subjects
-        category_filter = st.selectbox("Filter by Subject", subjects, key="subject_filter")
-    
+        category_filter = st.selectbox("Filter by Subject", ["All"] + subjects, key="subject_filter")
     with col2:
-        levels = ["All"] + sorted(
-            {course.get('level', 'N/A') for course in courses if course.get('level')}
-        )
-        level_filter = st.selectbox("Filter by Level", levels, key="level_filter")
-    
-    filtered_courses = paginated_courses
-    if category_filter != "All":
-        filtered_courses = [
-            c for c in filtered_courses 
-            if c.get('subject', c.get('Subject', c.get('SUBJECT'))) == category_filter
-        ]
-    if level_filter != "All":
-        filtered_courses = [
-            c for c in filtered_courses if c.get('level') == level_filter
-        ]
-    
-    if not filtered_courses:
-        st.warning("No courses match the selected filters.")
-        return
-    
-    for idx, course in enumerate(filtered_courses):
+        level_filter = st.selectbox("Filter by Level", ["All"] + levels, key="level_filter")
+
+    if 'enrolled_course_ids' not in st.session_state:
+        user_id = st.session_state.auth['user'].id
         try:
-            expander_label = f"{course.get('title', 'Untitled Course')} - {course.get('level', 'N/A')}"
-            with st.expander(expander_label):
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    st.write(f"Duration: {course.get('duration', 'Not specified')}")
-                    st.caption(f"Subject: {course.get('subject', course.get('Subject', course.get('SUBJECT', 'General')))})")
-                    st.write(course.get('description', 'No description available'))
-                with col2:
-                    st.metric("Subscribers", course.get('subscribers', 0))
-                    course_id = course.get('course_id', course.get('id', f"missing_id_{idx}"))
-                    try:
-                        course_id_int = int(course_id)
-                    except ValueError:
-                        course_id_int = f"missing_id_{idx}"
-                    button_key = f"enroll_{course_id}_{idx}"
-                    if st.button("Enroll", key=button_key):
-                        if course_id in (None, "", f"missing_id_{idx}"):
-                            st.error("Cannot enroll: Course ID is missing.")
-                        else:
-                            handle_enroll_course(course_id_int)
-                
-                if course.get('url'):
-                    st.markdown(f"[View Course]({course.get('url')})")
+            st.session_state.enrolled_course_ids = {
+                e['courses']['course_id'] for e in get_user_courses(user_id)
+            }
         except Exception as e:
-            st.error(f"Error displaying course: {str(e)}")
+            st.error(f"Error fetching user courses: {str(e)}")
+            return
+
+    items_per_page = 10
+    # Stack of cursors: the last entry is the course_id the current page starts after.
+    # Changing a filter starts the listing over from the first page.
+    filters = (category_filter, level_filter)
+    if st.session_state.get('course_filters') != filters:
+        st.session_state.course_filters = filters
+        st.session_state.course_cursors = [None]
+        st.session_state.prefetched_courses = {}
+
+    # Pages are fetched two at a time: the second half is kept for the "Next" click,
+    # so paging forward costs one round-trip every other page. Fetched pages stay
+    # stashed until the filters change, so reruns on a page (e.g. selecting a row)
+    # and paging back don't query again.
+    cursor = st.session_state.course_cursors[-1]
+    prefetched = st.session_state.setdefault('prefetched_courses', {})
+    courses = prefetched.get(cursor)
+    if courses is None:
+        try:
+            rows, _ = get_all_courses(
+                cursor=cursor,
+                page_size=items_per_page * 2,
+                subject=None if category_filter == "All" else category_filter,
+                level=None if level_filter == "All" else level_filter
+            )
+        except Exception as e:
+            st.error(f"Failed to fetch courses: {str(e)}")
+            return
+        courses = prefetched[cursor] = rows[:items_per_page]
+        if len(rows) > items_per_page:
+            prefetched[courses[-1]["course_id"]] = rows[items_per_page:]
+    next_cursor = courses[-1]["course_id"] if courses else None
+
+    page_number = len(st.session_state.course_cursors)
+    if not courses and page_number == 1:
+        if filters == ("All", "All"):
+            st.info("No courses available yet.")
+        else:
+            st.warning("No courses match the selected filters.")
+        return
+
+    prev_col, info_col, next_col = st.columns([1, 3, 1])
+    with prev_col:
+        if st.button("◀ Previous", disabled=page_number == 1, key="course_prev_page"):
+            st.session_state.course_cursors.pop()
+            st.rerun()
+    with info_col:
+        st.write(f"Page {page_number}")
+    with next_col:
+        if st.button("Next ▶", disabled=len(courses) < items_per_page, key="course_next_page"):
+            st.session_state.course_cursors.append(next_cursor)
+            st.rerun()
+
+    selected = show_course_table(courses, key=f"courses_table_{filters}_{cursor}")
+    if selected is None:
+        st.caption("Select a course to see its details and enroll.")
+    else:
+        show_course_details(courses[selected], enrollable=True)
 
 def show_my_courses():
     st.title("My Courses")
@@ -675,7 +909,11 @@ def show_my_courses():
         return
     
     user_id = st.session_state.auth['user'].id
-    user_courses = get_user_courses(user_id)
+    try:
+        user_courses = get_user_courses(user_id)
+    except Exception as e:
+        st.error(f"Error fetching user courses: {str(e)}")
+        return
     
     if not user_courses:
         st.info("You haven't enrolled in any courses yet. Go to 'View Courses' to enroll!")
@@ -683,29 +921,16 @@ def show_my_courses():
     
     st.write(f"Number of Enrolled Courses: {len(user_courses)}")
     
-    for idx, enrollment in enumerate(user_courses):
-        try:
-            course = enrollment.get('courses', {})
-            if not course:
-                st.warning(f"Course data missing for enrollment: {enrollment}")
-                continue
-                
-            expander_label = f"{course.get('title', 'Untitled Course')} - {course.get('level', 'N/A')}"
-            with st.expander(expander_label):
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    st.write(f"Duration: {course.get('duration', 'Not specified')}")
-                    st.caption(f"Subject: {course.get('subject', course.get('Subject', course.get('SUBJECT', 'General')))})")
-                    st.write(course.get('description', 'No description available'))
-                    st.progress(enrollment.get('progress', 0) / 100.0)
-                    st.write(f"Progress: {enrollment.get('progress', 0)}%")
-                with col2:
-                    st.metric("Subscribers", course.get('subscribers', 0))
-                
-                if course.get('url'):
-                    st.markdown(f"[View Course]({course.get('url')})")
-        except Exception as e:
-            st.error(f"Error displaying course: {str(e)}")
+    enrollments = [e for e in user_courses if e.get('courses')]
+    progress = [e.get('progress', 0) for e in enrollments]
+    selected = show_course_table([e['courses'] for e in enrollments], key="my_courses_table", progress=progress)
+    if selected is not None:
+        show_course_details(enrollments[selected]['courses'], progress=progress[selected])
+
+@st.cache_data(show_spinner=False)
+def _progress_df(pairs):
+    """Progress chart frame, memoized on the (title, progress) pairs so reruns reuse it."""
+    return pd.DataFrame(pairs, columns=["Course", "Progress"]).set_index("Course")
 
 def show_dashboard():
     st.title("Learning Dashboard")
@@ -740,54 +965,52 @@ def show_dashboard():
                     logger.error(f"Error updating name: {str(e)}")
                     st.error(f"Error updating name: {str(e)}")
     
-    user_courses = get_user_courses(user_id)
+    try:
+        bundle = get_dashboard_bundle(user_id)
+    except Exception as e:
+        logger.error(f"Error loading dashboard: {str(e)}")
+        st.error(f"Error loading dashboard: {str(e)}")
+        return
+    if bundle.get('role'):
+        user_data['role'] = bundle['role']
+    user_courses = bundle['enrolled']
     st.subheader("Progress Summary")
     col1, col2, col3 = st.columns(3)
     col1.metric("Courses Enrolled", len(user_courses))
-    avg_progress = sum(course.get('progress', 0) for course in user_courses) / len(user_courses) if user_courses else 0
+    avg_progress = float(bundle.get('avg_progress') or 0)
     col2.metric("Average Progress", f"{avg_progress:.1f}%")
     col3.metric("Last Active", user_data.get('last_login', 'Never'))
     
     if user_courses:
         st.subheader("Your Enrolled Courses")
-        for enrollment in user_courses:
-            course = enrollment.get('courses', {})
-            if not course:
-                continue
-            with st.expander(f"{course.get('title', 'Untitled Course')} - {course.get('level', 'N/A')}"):
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    st.write(f"**Subject**: {course.get('subject', 'General')}")
-                    st.write(f"**Duration**: {course.get('duration', 'Not specified')}")
-                    st.write(f"**Description**: {course.get('description', 'No description available')}")
-                    st.progress(enrollment.get('progress', 0) / 100.0)
-                    st.write(f"**Progress**: {enrollment.get('progress', 0)}%")
-                with col2:
-                    st.metric("Subscribers", course.get('subscribers', 0))
-                    if course.get('url'):
-                        st.markdown(f"[View Course]({course.get('url')})")
+        enrollments = [e for e in user_courses if e.get('courses')]
+        progress = [e.get('progress', 0) for e in enrollments]
+        selected = show_course_table([e['courses'] for e in enrollments], key="dashboard_courses_table", progress=progress)
+        if selected is not None:
+            show_course_details(enrollments[selected]['courses'], progress=progress[selected])
     else:
         st.info("You haven't enrolled in any courses yet. Go to 'View Courses' to enroll!")
     
+    if bundle['recent']:
+        st.subheader("Recently Added Courses")
+        for course in bundle['recent']:
+            st.write(f"- **{course['title']}** ({course['subject']}, {course['level']})")
+    
     if user_courses:
         st.subheader("Progress Chart")
-        progress_data = [
-            {"Course": enrollment['courses'].get('title', 'Untitled'), "Progress": enrollment.get('progress', 0)}
+        progress_pairs = tuple(
+            (enrollment['courses'].get('title', 'Untitled'), enrollment.get('progress', 0))
             for enrollment in user_courses if enrollment.get('courses')
-        ]
-        if progress_data:
-            df = pd.DataFrame(progress_data)
-            st.bar_chart(df.set_index("Course"), height=300, use_container_width=True)
+        )
+        if progress_pairs:
+            st.bar_chart(_progress_df(progress_pairs), height=300, use_container_width=True)
 
-    if 'rag_pipeline' not in st.session_state:
-        try:
-            st.session_state.rag_pipeline = RAGPipeline(supabase_client=supabase)
-            st.session_state.rag_pipeline.setup_agents()
-            st.success("Learning Assistant initialized successfully!")
-        except Exception as e:
-            logger.error(f"Failed to initialize Learning Assistant: {str(e)}")
-            st.error(f"Failed to initialize Learning Assistant: {str(e)}")
-            return
+    try:
+        rag_pipeline = get_rag_pipeline()
+    except Exception as e:
+        logger.error(f"Failed to initialize Learning Assistant: {str(e)}")
+        st.error(f"Failed to initialize Learning Assistant: {str(e)}")
+        return
 
     st.subheader("Learning Assistant")
     user_input = st.text_input(
@@ -799,15 +1022,7 @@ def show_dashboard():
     if user_input:
         with st.spinner("Processing your question..."):
             try:
-                user_courses = get_user_courses(user_id)
-                course_context = "\n".join([
-                    f"Course: {course['courses']['title']}\nSubject: {course['courses']['subject']}\nDescription: {course['courses']['description']}"
-                    for course in user_courses
-                ]) if user_courses else "The user has not enrolled in any courses yet."
-                
-                full_query = f"User's enrolled courses:\n{course_context}\n\nQuestion: {user_input}"
-                
-                response = st.session_state.rag_pipeline.basic_rag_chain(full_query, user_id=user_id)
+                response = answer_question(user_input, user_id, build_course_context(user_id))
                 st.write(f"**Learning Assistant**: {response}")
                 
                 with st.expander("Provide Feedback"):
@@ -818,13 +1033,7 @@ def show_dashboard():
                             if len(feedback_text) > 1000:
                                 st.error("Feedback is too long (max 1000 characters)")
                             else:
-                                supabase.table("feedback").insert({
-                                    "user_id": user_id,
-                                    "query": user_input[:500],
-                                    "response": response[:2000],
-                                    "feedback": feedback_text,
-                                    "created_at": datetime.now().isoformat()
-                                }).execute()
+                                submit_feedback(user_id, user_input, response, feedback_text)
                                 st.success("Thank you for your feedback!")
             except Exception as e:
                 logger.error(f"Error processing question: {str(e)}")
@@ -839,7 +1048,10 @@ def show_dashboard():
     )
 
     if uploaded_file:
-        with st.spinner(f"Processing '{uploaded_file.name}'..."):
+        if 'ingest_jobs' not in st.session_state:
+            st.session_state.ingest_jobs = {}
+        if uploaded_file.file_id not in st.session_state.ingest_jobs:
+            tmp_file_path = None
             try:
                 file_size_mb = uploaded_file.size / (1024 * 1024)
                 if uploaded_file.size > 200 * 1024 * 1024:
@@ -847,33 +1059,59 @@ def show_dashboard():
                     return
                 st.write(f"**File**: {uploaded_file.name} ({file_size_mb:.2f} MB)")
                 
-                with tempfile.NamedTemporaryFile(delete=False, suffix=uploaded_file.name) as tmp_file:
-                    tmp_file.write(uploaded_file.read())
-                    tmp_file_path = tmp_file.name
-                
                 file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-                loader_class = st.session_state.rag_pipeline.loaders.get(file_extension)
+                loader_class = rag_pipeline.loaders.get(file_extension)
                 if not loader_class:
                     st.error(f"Unsupported file type: {file_extension}")
+                    return
+                
+                if file_extension == ".txt":
+                    # Plain text needs no loader, so skip the temp file and read the upload's buffer
+                    documents = [Document(
+                        page_content=uploaded_file.getvalue().decode("utf-8"),
+                        metadata={"source": uploaded_file.name}
+                    )]
                 else:
-                    loader = loader_class(tmp_file_path)
-                    documents = loader.load()
-                    success = st.session_state.rag_pipeline.add_documents(documents, user_id)
-                    if success:
-                        st.success(f"Successfully added '{uploaded_file.name}' to your knowledge base!")
-                        with st.expander("View Uploaded File Content"):
-                            for doc in documents[:1]:
-                                preview = doc.page_content[:1000] + "..." if len(doc.page_content) > 1000 else doc.page_content
-                                st.text(preview)
-                    else:
-                        st.warning("Failed to add file to knowledge base")
-                os.unlink(tmp_file_path)
+                    # Copy in 1MB chunks so the whole upload is never held in memory twice
+                    progress_bar = st.progress(0.0, text="Saving upload...")
+                    uploaded_file.seek(0)
+                    bytes_written = 0
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=uploaded_file.name) as tmp_file:
+                        tmp_file_path = tmp_file.name
+                        while chunk := uploaded_file.read(UPLOAD_CHUNK_SIZE):
+                            tmp_file.write(chunk)
+                            bytes_written += len(chunk)
+                            progress_bar.progress(min(bytes_written / uploaded_file.size, 1.0), text="Saving upload...")
+                    progress_bar.empty()
+                    documents = loader_class(tmp_file_path).lazy_load()
+                
+                # Loading and embedding can take tens of seconds; run it off the script thread
+                st.session_state.ingest_jobs[uploaded_file.file_id] = get_ingest_executor().submit(
+                    ingest_file, rag_pipeline, documents, user_id, tmp_file_path
+                )
             except Exception as e:
                 logger.error(f"Error processing file: {str(e)}")
                 st.error(f"Error processing file: {str(e)}")
-            finally:
-                if 'tmp_file_path' in locals():
+                if tmp_file_path and os.path.exists(tmp_file_path):
                     os.unlink(tmp_file_path)
+                return
+        
+        future = st.session_state.ingest_jobs[uploaded_file.file_id]
+        if not future.done():
+            show_ingest_progress(uploaded_file.file_id, uploaded_file.name)
+        elif future.exception():
+            logger.error(f"Error processing file: {str(future.exception())}")
+            st.error(f"Error processing file: {str(future.exception())}")
+        else:
+            success, preview_docs = future.result()
+            if success:
+                st.success(f"Successfully added '{uploaded_file.name}' to your knowledge base!")
+                with st.expander("View Uploaded File Content"):
+                    for doc in preview_docs:
+                        preview = doc.page_content[:1000] + "..." if len(doc.page_content) > 1000 else doc.page_content
+                        st.text(preview)
+            else:
+                st.warning("Failed to add file to knowledge base")
 
 def show_admin_panel():
     st.title("Admin Panel")
@@ -882,6 +1120,13 @@ def show_admin_panel():
         st.error("Access denied: Only admins can view this page")
         return
     
+    # The two lists are independent; fetch them concurrently so the panel waits for the
+    # slower one rather than both in turn
+    executor = get_background_executor()
+    user_search = st.session_state.get("admin_user_search", "").strip()
+    users_future = executor.submit(list_users, user_search)
+    courses_future = executor.submit(get_all_courses)
+    
     st.subheader("Add New User")
     with st.form("add_user_form"):
         email = st.text_input("Email", key="admin_add_user_email")
@@ -889,10 +1134,12 @@ def show_admin_panel():
         full_name = st.text_input("Full Name", key="admin_add_user_full_name")
         role = st.selectbox("Role", ["user", "admin"], key="admin_add_user_role")
         if st.form_submit_button("Add User"):
-            admin_add_user(email, password, full_name, role)
+            if admin_add_user(email, password, full_name, role):
+                users_future = executor.submit(list_users, user_search)  # the prefetched list predates the new user
     
     st.subheader("Delete User")
-    users = supabase.table("users").select("id, email, full_name, role").execute().data
+    st.text_input("Filter users by email", key="admin_user_search")
+    users = users_future.result()
     if users:
         user_options = {f"{user['email']} ({user['full_name']})": user['id'] for user in users}
         user_to_delete = st.selectbox("Select User to Delete", list(user_options.keys()), key="delete_user_select")
@@ -903,10 +1150,16 @@ def show_admin_panel():
         st.info("No users found")
     
     st.subheader("Add New Course")
-    show_add_course()
+    if show_add_course():
+        courses_future = executor.submit(get_all_courses)
     
     st.subheader("Delete Course")
-    courses = get_all_courses()
+    try:
+        courses, _ = courses_future.result()
+    except Exception as e:
+        logger.error(f"Error loading courses: {str(e)}")
+        st.error(f"Error loading courses: {str(e)}")
+        courses = []
     if courses:
         course_options = {f"{course['title']} ({course['subject']})": course['course_id'] for course in courses}
         course_to_delete = st.selectbox("Select Course to Delete", list(course_options.keys()), key="delete_course_select")
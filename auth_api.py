@@ -1,47 +1,59 @@
-# pip install fastapi supabase python-jose[cryptography] passlib python-dotenv uvicorn
+# pip install fastapi supabase python-jose[cryptography] passlib argon2-cffi bcrypt cachetools python-dotenv uvicorn
 # python auth_api.py
 
 # File: auth_api.py
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from supabase import create_client
+from postgrest.exceptions import APIError
+from db import get_async_supabase
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from passlib.context import CryptContext
-from typing import Optional
+from typing import Optional, Tuple
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+import asyncio
 
 load_dotenv()
 
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+# Async client, created in the startup hook
+supabase = None
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-def setup_database():
+# email -> UserInDB for get_current_user, so a client's burst of authenticated requests
+# costs one users SELECT per 30s instead of one per request
+USER_CACHE = TTLCache(maxsize=10_000, ttl=30)
+
+# Bump when setup_database() changes; recorded in schema_meta once the setup has run
+SCHEMA_VERSION = 2
+
+async def setup_database():
     try:
-        supabase.postgrest.rpc("execute_sql", {
+        await supabase.postgrest.rpc("execute_sql", {
             "query": """
                 CREATE TABLE IF NOT EXISTS users (
                     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
                     email TEXT UNIQUE NOT NULL,
                     password_hash TEXT NOT NULL,
                     full_name TEXT,
-                    created_at TIMESTAMP NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
                     last_login TIMESTAMP
                 );
             """
         }).execute()
 
-        supabase.postgrest.rpc("execute_sql", {
+        await supabase.postgrest.rpc("execute_sql", {
             "query": "ALTER TABLE users ENABLE ROW LEVEL SECURITY;"
         }).execute()
 
         try:
-            supabase.postgrest.rpc("execute_sql", {
+            await supabase.postgrest.rpc("execute_sql", {
                 "query": """
                     CREATE POLICY "Users can only access their own data" ON users
                     FOR ALL TO authenticated
@@ -54,18 +66,53 @@ def setup_database():
             else:
                 raise e
 
+        await supabase.postgrest.rpc("execute_sql", {
+            "query": f"""
+                ALTER TABLE users ALTER COLUMN created_at SET DEFAULT now();
+                CREATE TABLE IF NOT EXISTS schema_meta (
+                    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                    version INT NOT NULL
+                );
+                INSERT INTO schema_meta (id, version) VALUES (1, {SCHEMA_VERSION})
+                ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version;
+                NOTIFY pgrst, 'reload schema';
+            """
+        }).execute()
+
         print("✅ Database schema and policies set up successfully")
     except Exception as e:
         print(f"❌ Database setup error: {str(e)}")
         raise
 
-
-setup_database()
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+async def schema_version_matches() -> bool:
+    try:
+        result = await supabase.table("schema_meta").select("version").eq("id", 1).execute()
+    except Exception:
+        return False  # schema_meta doesn't exist yet
+    return bool(result.data) and result.data[0]["version"] >= SCHEMA_VERSION
+
+# argon2id with the OWASP minimums (19 MiB, 2 passes) is cheaper per login than bcrypt's
+# 12 rounds. bcrypt stays listed so existing hashes still verify; deprecated="auto" marks
+# them for rehashing on the user's next successful login.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global supabase
+    supabase = await get_async_supabase()
+    # One SELECT per worker start; the three setup RPCs only run when the schema is behind
+    if not await schema_version_matches():
+        await setup_database()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 class UserCreate(BaseModel):
     email: str
@@ -84,8 +131,9 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Returns (valid, new_hash); new_hash is set when the stored hash should be upgraded."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -111,38 +159,58 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    user = supabase.table("users").select("*").eq("email", token_data.email).execute()
+    cached_user = USER_CACHE.get(token_data.email)
+    if cached_user is not None:
+        return cached_user
+    
+    user = await supabase.table("users").select("*").eq("email", token_data.email).execute()
     if not user.data:
         raise credentials_exception
-    return UserInDB(**user.data[0])
+    current_user = UserInDB(**user.data[0])
+    USER_CACHE[token_data.email] = current_user
+    return current_user
 
 @app.post("/signup", response_model=Token)
 async def signup(user: UserCreate):
     try:
-        existing_user = supabase.table("users").select("*").eq("email", user.email).execute()
-        if existing_user.data:
-            raise HTTPException(status_code=400, detail="Email already registered")
-        
-        hashed_password = get_password_hash(user.password)
+        # Hashing is CPU-bound; run it off the event loop so other requests keep flowing
+        hashed_password = await asyncio.to_thread(get_password_hash, user.password)
         new_user = {
             "email": user.email,
             "password_hash": hashed_password,
-            "full_name": user.full_name,
-            "created_at": datetime.utcnow().isoformat()  # Convert to ISO 8601 format string
+            "full_name": user.full_name
         }
-        result = supabase.table("users").insert(new_user).execute()
+        # users.email is UNIQUE, so the insert itself is the duplicate check (one round-trip)
+        try:
+            await supabase.table("users").insert(new_user).execute()
+        except APIError as e:
+            if e.code == "23505":  # unique_violation
+                raise HTTPException(status_code=400, detail="Email already registered")
+            raise
         
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
         
         return {"access_token": access_token, "token_type": "bearer"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Signup failed: {str(e)}")
 
+async def record_login(user_id: str, new_hash: Optional[str] = None):
+    await supabase.rpc("touch_last_login", {"uid": user_id}).execute()
+    if new_hash:
+        await supabase.table("users").update({"password_hash": new_hash}).eq("id", user_id).execute()
+
 @app.post("/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = supabase.table("users").select("*").eq("email", form_data.username).execute()
-    if not user.data or not verify_password(form_data.password, user.data[0]["password_hash"]):
+async def login(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await supabase.table("users").select("*").eq("email", form_data.username).execute()
+    valid, new_hash = (False, None)
+    if user.data:
+        valid, new_hash = await asyncio.to_thread(
+            verify_password, form_data.password, user.data[0]["password_hash"]
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -150,7 +218,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
     
     user_data = user.data[0]
-    supabase.table("users").update({"last_login": datetime.utcnow().isoformat()}).eq("email", form_data.username).execute()
+    USER_CACHE.pop(user_data["email"], None)  # last_login (and maybe the hash) changes below
+    # Recorded after the response is sent; the token doesn't depend on it
+    background_tasks.add_task(record_login, user_data["id"], new_hash)
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
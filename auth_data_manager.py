@@ -1,15 +1,15 @@
 # auth_data_manager.py
-from supabase import create_client, Client
+from supabase import Client
+from db import new_supabase_client
 import os
 from typing import Optional, Dict, Any
-from datetime import datetime
 
 class SupabaseAuthManager:
     def __init__(self):
-        """Initialize Supabase client"""
+        """Own Supabase client: sign_in stores this user's session on it"""
         self.url: str = os.environ.get("SUPABASE_URL")
         self.key: str = os.environ.get("SUPABASE_KEY")
-        self.supabase: Client = create_client(self.url, self.key)
+        self.supabase: Client = new_supabase_client()
         
     # Authentication Methods
     def sign_up(self, email: str, password: str, user_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -31,6 +31,7 @@ class SupabaseAuthManager:
                     "data": {
                         "full_name": user_data.get("full_name"),
                         "avatar_url": user_data.get("avatar_url", ""),
+                        "learning_level": user_data.get("learning_level", "beginner"),
                         "learning_preferences": user_data.get("preferences", {})
                     }
                 }
@@ -39,24 +40,11 @@ class SupabaseAuthManager:
             if auth_response.user is None:
                 raise Exception("User creation failed")
             
-            # Create profile in public.users table
-            profile_data = {
-                "user_id": auth_response.user.id,
-                "email": email,
-                "full_name": user_data.get("full_name"),
-                "learning_level": user_data.get("learning_level", "beginner"),
-                "preferences": user_data.get("preferences", {}),
-                "created_at": datetime.now().isoformat()
-            }
-            
-            profile_response = self.supabase.table("users").insert(profile_data).execute()
-            
-            if profile_response.error:
-                raise Exception(profile_response.error.message)
-            
+            # The public.users profile is created in the same transaction by the
+            # on_auth_user_created trigger (schema.sql); the metadata above is its source
             return {
                 "user": auth_response.user,
-                "profile": profile_response.data[0] if profile_response.data else None
+                "profile": auth_response.user.user_metadata
             }
             
         except Exception as e:
@@ -81,13 +69,11 @@ class SupabaseAuthManager:
             if response.user is None:
                 raise Exception("Authentication failed")
             
-            # Update last login
-            update_response = self.supabase.table("users").update({
-                "last_login": datetime.now().isoformat()
-            }).eq("user_id", response.user.id).execute()
-            
-            if update_response.error:
-                print(f"[Update Last Login Error] {update_response.error.message}")
+            # Update last login (stamped with now() by the database, see schema.sql)
+            try:
+                self.supabase.rpc("touch_last_login", {"uid": response.user.id}).execute()
+            except Exception as e:
+                print(f"[Update Last Login Error] {str(e)}")
             
             return {
                 "user": response.user,
@@ -133,7 +119,6 @@ class SupabaseAuthManager:
                 "user_id": user_id,
                 "course_id": course_id,
                 "completion_percentage": progress,
-                "last_accessed": datetime.now().isoformat(),
                 "data": metadata
             }).execute()
             
@@ -185,7 +170,6 @@ class SupabaseAuthManager:
                 "session_id": session_id,
                 "message": message,
                 "response": response,
-                "timestamp": datetime.now().isoformat(),
                 "metadata": metadata
             }
             
@@ -0,0 +1,79 @@
+# db.py
+# Shared Supabase client for app.py, auth_api.py, auth_data_manager.py, fastapi.py and rag_pipeline.py
+
+import os
+import weakref
+from functools import lru_cache
+
+import httpx
+from supabase import create_client, acreate_client, Client, AsyncClient
+from supabase.lib.client_options import SyncClientOptions, AsyncClientOptions
+
+# Request timeout (seconds), so a slow Supabase call fails fast instead of holding a
+# worker and its connection open
+SUPABASE_TIMEOUT = 10
+
+_async_supabase = None
+
+@lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    """Process-wide Supabase client.
+
+    Backed by one keep-alive httpx client, so TCP/TLS handshakes are paid once per
+    connection instead of once per request. Never sign in or set a session on it: the
+    JWT would apply to every caller. Per-user auth goes through new_supabase_client().
+    """
+    return new_supabase_client()
+
+def new_supabase_client() -> Client:
+    """A Supabase client with its own auth state and keep-alive connections.
+
+    For one signed-in user, e.g. one Streamlit session. The httpx client is not shared:
+    postgrest sets the user's Authorization header on it. It is closed when the returned
+    client is garbage-collected, so dropped sessions don't leave connections open.
+    """
+    url, key = _credentials()
+    http_client = httpx.Client(
+        http2=True,
+        timeout=SUPABASE_TIMEOUT,
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
+    options = SyncClientOptions(
+        schema="public",
+        postgrest_client_timeout=SUPABASE_TIMEOUT,
+        storage_client_timeout=SUPABASE_TIMEOUT,
+        httpx_client=http_client
+    )
+    client = create_client(url, key, options=options)
+    weakref.finalize(client, http_client.close)
+    return client
+
+async def get_async_supabase() -> AsyncClient:
+    """Process-wide async Supabase client, for FastAPI handlers.
+
+    Same settings as get_supabase(), but requests are awaited so the event loop keeps
+    serving other requests during the round-trip.
+    """
+    global _async_supabase
+    if _async_supabase is None:
+        url, key = _credentials()
+        http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=SUPABASE_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=20)
+        )
+        options = AsyncClientOptions(
+            schema="public",
+            postgrest_client_timeout=SUPABASE_TIMEOUT,
+            storage_client_timeout=SUPABASE_TIMEOUT,
+            httpx_client=http_client
+        )
+        _async_supabase = await acreate_client(url, key, options=options)
+    return _async_supabase
+
+def _credentials():
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in the .env file")
+    return url, key
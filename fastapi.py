@@ -1,11 +1,22 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
+from fastapi.responses import ORJSONResponse
+from supabase import AsyncClient
+from db import get_async_supabase
 from pydantic import BaseModel
 from typing import Optional, List
+from cachetools import TTLCache
+from jose import jwt
+import hashlib
+import orjson
+import time
+import tempfile
 from datetime import datetime
-import os
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import asyncpg
+import os
 import logging
 
 # Set up logging
@@ -14,16 +25,42 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Initialize Supabase client
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in the .env file")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Async Supabase client, created in lifespan (raises ValueError if the credentials are missing)
+supabase: Optional[AsyncClient] = None
+
+# Optional direct Postgres connection for the read-heavy endpoints (Supabase: Project
+# Settings > Database > Connection string, direct connection). Without it every read goes
+# through PostgREST as before.
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global supabase
+    supabase = await get_async_supabase()
+    app.state.pool = None
+    if DATABASE_URL:
+        # Pooled connections keep TCP/TLS and prepared statements alive across requests
+        app.state.pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=10,
+            max_size=50,
+            max_inactive_connection_lifetime=300,
+            statement_cache_size=1024
+        )
+    yield
+    if app.state.pool:
+        await app.state.pool.close()
+
+# Chunk size (bytes) for spooling uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Initialize FastAPI app; orjson encodes the large list responses (users, courses,
+# messages) several times faster than the stdlib json module
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
-# Initialize FastAPI app
-app = FastAPI()
+def get_pool(request: Request) -> Optional[asyncpg.Pool]:
+    return request.app.state.pool
 
 # Security for JWT token validation
 security = HTTPBearer()
@@ -67,26 +104,53 @@ class UserCourse(BaseModel):
     user_id: str
     course_id: str
 
+# blake2b(token) -> (user_id, exp). Tokens already validated by Supabase Auth skip the
+# get_user round-trip for up to 5 minutes, and never past their own expiry.
+_token_cache = TTLCache(maxsize=50_000, ttl=300)
+
+def _token_key(token: str) -> str:
+    # Hashed so raw bearer tokens aren't kept in memory
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
 # Dependency to get the current user from JWT token
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
+    key = _token_key(token)
+    cached = _token_cache.get(key)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
     try:
-        user = supabase.auth.get_user(token)
+        user = await supabase.auth.get_user(token)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid token")
+        # Signature was just checked by Supabase; only the expiry is read locally
+        exp = jwt.get_unverified_claims(token).get("exp", 0)
+        _token_cache[key] = (user.user.id, exp)
         return user.user.id
     except Exception as e:
         logger.error(f"Token validation error: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Serialized course reads (body, ETag), keyed "all" or "course:{id}"; cleared whenever a
+# course is added, updated or deleted through this API
+_courses_cache = TTLCache(maxsize=1024, ttl=30)
+
+# user_id -> is admin. Saves a users SELECT on every admin-gated request; entries are
+# dropped when the user is removed, otherwise a role change applies within 60s.
+_admin_cache = TTLCache(maxsize=10_000, ttl=60)
+
 # Helper function to check admin status
-def check_admin(user_id: str) -> bool:
+async def check_admin(user_id: str) -> bool:
+    if user_id in _admin_cache:
+        return _admin_cache[user_id]
     try:
-        user = supabase.table("users").select("role").eq("id", user_id).execute()
+        user = await supabase.table("users").select("role").eq("id", user_id).execute()
         if not user.data:
             logger.warning(f"User not found: {user_id}")
             return False
-        return user.data[0]["role"] == "admin"
+        is_admin = user.data[0]["role"] == "admin"
+        _admin_cache[user_id] = is_admin
+        return is_admin
     except Exception as e:
         logger.error(f"Error checking admin status for user {user_id}: {str(e)}")
         return False
@@ -96,24 +160,31 @@ def check_admin(user_id: str) -> bool:
 async def add_user(user: UserCreate):
     logger.info(f"Received request to add user: {user.email}")
     try:
-        # Check if the email already exists in Supabase Auth
-        existing_users = supabase.auth.admin.list_users()
-        for u in existing_users:
-            if u.email == user.email:
-                logger.warning(f"Email already registered: {user.email}")
-                raise HTTPException(status_code=400, detail=f"Email {user.email} is already registered")
+        # Every auth user has a profile row (on_auth_user_created), so one indexed lookup
+        # replaces scanning the whole auth user list
+        existing_user = await supabase.table("users").select("id").eq("email", user.email).limit(1).execute()
+        if existing_user.data:
+            logger.warning(f"Email already registered: {user.email}")
+            raise HTTPException(status_code=400, detail=f"Email {user.email} is already registered")
 
         # Sign up the user with Supabase Auth
         data = user.dict()
-        signup_response = supabase.auth.sign_up({"email": user.email, "password": "defaultpassword123"})
+        try:
+            signup_response = await supabase.auth.sign_up({"email": user.email, "password": "defaultpassword123"})
+        except Exception as e:
+            # Auth still rejects duplicates the profile lookup missed (e.g. a concurrent signup)
+            if "already registered" in str(e):
+                logger.warning(f"Email already registered: {user.email}")
+                raise HTTPException(status_code=400, detail=f"Email {user.email} is already registered")
+            raise
         if not signup_response.user:
             logger.error("Failed to sign up user with Supabase Auth")
             raise HTTPException(status_code=400, detail="Failed to sign up user with Supabase Auth")
         data["id"] = str(signup_response.user.id)
         logger.info(f"User signed up with ID: {data['id']}")
 
-        # Insert into users table
-        response = supabase.table("users").insert(data).execute()
+        # Fill in the profile row on_auth_user_created (schema.sql) has already inserted
+        response = await supabase.table("users").upsert(data).execute()
         if not response.data:
             logger.error("Failed to insert user into Supabase")
             raise HTTPException(status_code=400, detail="Failed to insert user into Supabase")
@@ -127,14 +198,19 @@ async def add_user(user: UserCreate):
 
 @app.delete("/users/{user_id}")
 async def remove_user(user_id: str, current_user_id: str = Depends(get_current_user)):
-    if not check_admin(current_user_id):
+    if not await check_admin(current_user_id):
         raise HTTPException(status_code=403, detail="Only admins can remove users")
     try:
-        response = supabase.table("users").delete().eq("id", user_id).execute()
+        response = await supabase.table("users").delete().eq("id", user_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="User not found")
+        _admin_cache.pop(user_id, None)
+        # Cached tokens are keyed by hash, so drop every entry for the removed user
+        for key, (cached_user_id, _) in list(_token_cache.items()):
+            if cached_user_id == user_id:
+                _token_cache.pop(key, None)
         # Also delete from Supabase Auth
-        supabase.auth.admin.delete_user(user_id)
+        await supabase.auth.admin.delete_user(user_id)
         return {"message": "User removed successfully"}
     except Exception as e:
         logger.error(f"Error removing user {user_id}: {str(e)}")
@@ -142,56 +218,84 @@ async def remove_user(user_id: str, current_user_id: str = Depends(get_current_u
 
 @app.get("/users/{user_id}", response_model=dict)
 async def get_user_data(user_id: str, current_user_id: str = Depends(get_current_user)):
-    if user_id != current_user_id and not check_admin(current_user_id):
+    if user_id != current_user_id and not await check_admin(current_user_id):
         raise HTTPException(status_code=403, detail="Not authorized to view this user's data")
-    response = supabase.table("users").select("*").eq("id", user_id).execute()
+    response = await supabase.table("users").select("*").eq("id", user_id).execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="User not found")
     return response.data[0]
 
 @app.get("/users/", response_model=List[dict])
 async def get_all_users(current_user_id: str = Depends(get_current_user)):
-    if not check_admin(current_user_id):
+    if not await check_admin(current_user_id):
         raise HTTPException(status_code=403, detail="Only admins can view all users")
-    response = supabase.table("users").select("*").execute()
+    response = await supabase.table("users").select("*").execute()
     return response.data
 
 @app.post("/courses/", response_model=dict)
 async def add_course(course: CourseCreate, current_user_id: str = Depends(get_current_user)):
-    if not check_admin(current_user_id):
+    if not await check_admin(current_user_id):
         raise HTTPException(status_code=403, detail="Only admins can add courses")
     try:
         data = course.dict()
         data["created_by"] = current_user_id
         data["created_at"] = datetime.now().isoformat()
-        response = supabase.table("courses").insert(data).execute()
+        response = await supabase.table("courses").insert(data).execute()
         if not response.data:
             raise HTTPException(status_code=400, detail="Failed to add course")
+        _courses_cache.clear()
         return response.data[0]
     except Exception as e:
         logger.error(f"Error adding course: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+async def _cached_courses_response(request: Request, key: str, load) -> Response:
+    """Serve a course read from _courses_cache with an ETag; `load` runs only on a cache miss."""
+    cached = _courses_cache.get(key)
+    if cached is None:
+        body = orjson.dumps(jsonable_encoder(await load()))
+        cached = (body, f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"')
+        _courses_cache[key] = cached
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/courses/{course_id}", response_model=dict)
-async def view_course_details(course_id: str):
-    response = supabase.table("courses").select("*").eq("course_id", course_id).execute()
-    if not response.data:
-        raise HTTPException(status_code=404, detail="Course not found")
-    return response.data[0]
+async def view_course_details(course_id: str, request: Request, pool: Optional[asyncpg.Pool] = Depends(get_pool)):
+    async def load():
+        if pool:
+            if not course_id.isdigit():
+                raise HTTPException(status_code=404, detail="Course not found")
+            row = await pool.fetchrow("SELECT * FROM courses WHERE course_id = $1", int(course_id))
+            if not row:
+                raise HTTPException(status_code=404, detail="Course not found")
+            return dict(row)
+        response = await supabase.table("courses").select("*").eq("course_id", course_id).execute()
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Course not found")
+        return response.data[0]
+    return await _cached_courses_response(request, f"course:{course_id}", load)
 
 @app.get("/courses/", response_model=List[dict])
-async def get_all_courses():
-    response = supabase.table("courses").select("*").execute()
-    return response.data
+async def get_all_courses(request: Request, pool: Optional[asyncpg.Pool] = Depends(get_pool)):
+    async def load():
+        if pool:
+            return [dict(row) for row in await pool.fetch("SELECT * FROM courses")]
+        response = await supabase.table("courses").select("*").execute()
+        return response.data
+    return await _cached_courses_response(request, "all", load)
 
 @app.put("/courses/{course_id}", response_model=dict)
 async def rename_course(course_id: str, course: CourseUpdate, current_user_id: str = Depends(get_current_user)):
-    if not check_admin(current_user_id):
+    if not await check_admin(current_user_id):
         raise HTTPException(status_code=403, detail="Only admins can rename courses")
     data = {k: v for k, v in course.dict().items() if v is not None}
-    response = supabase.table("courses").update(data).eq("course_id", course_id).execute()
+    response = await supabase.table("courses").update(data).eq("course_id", course_id).execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="Course not found")
+    _courses_cache.clear()
     return response.data[0]
 
 @app.get("/courses/{course_id}/assets", response_model=dict)
@@ -201,21 +305,22 @@ async def get_course_assets(course_id: str):
 
 @app.delete("/courses/{course_id}")
 async def delete_course(course_id: str, current_user_id: str = Depends(get_current_user)):
-    if not check_admin(current_user_id):
+    if not await check_admin(current_user_id):
         raise HTTPException(status_code=403, detail="Only admins can delete courses")
-    response = supabase.table("courses").delete().eq("course_id", course_id).execute()
+    response = await supabase.table("courses").delete().eq("course_id", course_id).execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="Course not found")
+    _courses_cache.clear()
     return {"message": "Course deleted successfully"}
 
 @app.post("/user-courses/")
 async def add_student_to_course(user_course: UserCourse, current_user_id: str = Depends(get_current_user)):
-    if not check_admin(current_user_id):
+    if not await check_admin(current_user_id):
         raise HTTPException(status_code=403, detail="Only admins can add students to courses")
     try:
         data = user_course.dict()
         data["enrolled_at"] = datetime.now().isoformat()
-        response = supabase.table("user_courses").insert(data).execute()
+        response = await supabase.table("user_courses").insert(data).execute()
         if not response.data:
             raise HTTPException(status_code=400, detail="Failed to enroll student")
         return response.data[0]
@@ -233,7 +338,7 @@ async def post_message_to_chatbot(chat: ChatMessage, current_user_id: str = Depe
         }
         # Placeholder for chatbot response (you can integrate an AI model here)
         data["response"] = "This is a placeholder response from the chatbot."
-        response = supabase.table("chatbot_messages").insert(data).execute()
+        response = await supabase.table("chatbot_messages").insert(data).execute()
         if not response.data:
             raise HTTPException(status_code=400, detail="Failed to save message")
         return response.data[0]
@@ -242,18 +347,31 @@ async def post_message_to_chatbot(chat: ChatMessage, current_user_id: str = Depe
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/chatbot/messages/", response_model=List[dict])
-async def get_messages_from_chatbot(current_user_id: str = Depends(get_current_user)):
-    response = supabase.table("chatbot_messages").select("*").eq("user_id", current_user_id).execute()
+async def get_messages_from_chatbot(current_user_id: str = Depends(get_current_user), pool: Optional[asyncpg.Pool] = Depends(get_pool)):
+    if pool:
+        rows = await pool.fetch("SELECT * FROM chatbot_messages WHERE user_id = $1", current_user_id)
+        return [dict(row) for row in rows]
+    response = await supabase.table("chatbot_messages").select("*").eq("user_id", current_user_id).execute()
     return response.data
 
 # Bonus: Upload file as knowledge to chatbot
 @app.post("/chatbot/upload/")
 async def upload_file_to_chatbot(file: UploadFile = File(...), current_user_id: str = Depends(get_current_user)):
     try:
-        contents = await file.read()
+        # Spool to disk 1MB at a time; storage streams the upload from the open file, so
+        # it is never held in memory whole. The handle is ours to close: given a path,
+        # storage opens the file itself and never closes it.
+        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+            tmp_file_path = tmp_file.name
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                tmp_file.write(chunk)
         file_name = f"{current_user_id}/{file.filename}"
-        supabase.storage.from_("chatbot-files").upload(file_name, contents)
+        with open(tmp_file_path, "rb") as upload_file:
+            await supabase.storage.from_("chatbot-files").upload(file_name, upload_file)
         return {"message": f"File {file.filename} uploaded successfully"}
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if 'tmp_file_path' in locals():
+            os.unlink(tmp_file_path)
\ No newline at end of file
@@ -21,10 +21,10 @@ df['title'] = df['title'].replace({
 df['created_by'] = 'f43f8ba4-4c8a-4758-b9a4-ca3b03501148'
 
 # Add description (placeholder)
-df['description'] = df['title'].apply(lambda x: f"Learn about {x.lower()}" if isinstance(x, str) else "No description available")
+df['description'] = ("Learn about " + df['title'].str.lower()).fillna("No description available")
 
 # Fix url (placeholder, replace with actual URLs if available)
-df['url'] = df['url'].apply(lambda x: 'https://www.example.com/course' if x == 'https://www' else x)
+df['url'] = df['url'].mask(df['url'].eq('https://www'), 'https://www.example.com/course')
 
 # Fix subject
 df['subject'] = df['subject'].replace('Business F', 'Business Finance')
@@ -39,10 +39,15 @@ df = df.drop(columns=['published_at'])
 # Add created_at
 df['created_at'] = datetime.now().isoformat()
 
-# Ensure data types
-df['price'] = df['price'].astype(float)
-df['subscribers'] = df['subscribers'].astype(int)
-df['is_paid'] = df['is_paid'].astype(bool)
+# Ensure data types in one pass; 32-bit numbers halve those columns, and subject/level
+# (a handful of distinct values) are stored as category codes instead of repeated strings
+df = df.astype({
+    'price': 'float32',
+    'subscribers': 'int32',
+    'is_paid': 'bool',
+    'subject': 'category',
+    'level': 'category'
+})
 
 # Reorder columns to match schema
 columns = [
@@ -1,18 +1,20 @@
 # rag_pipeline.py
 
-from typing import List
+from typing import Iterable, List
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, models
 from crewai import Agent, Task, Crew
-from supabase import create_client
+from db import get_supabase
 import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 import logging  # Added for logging
 
 # Suppress litellm provider list warnings
@@ -21,6 +23,43 @@ logging.getLogger("litellm").setLevel(logging.WARNING)
 # Load environment variables
 load_dotenv()
 
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Quantized weights to load; use onnx/model_qint8_avx2.onnx (or onnx/model_qint8_arm64.onnx) on
+# CPUs without AVX-512 VNNI
+ONNX_EMBEDDING_FILE = os.getenv("ONNX_EMBEDDING_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+
+# Chunks embedded and upserted per call in add_documents
+EMBED_BATCH_SIZE = 64
+
+# user_documents keeps int8 copies of its vectors in RAM (4x smaller than float32);
+# searches scan those, then rescore the top 2x candidates with the full vectors
+QUANTIZATION_CONFIG = models.ScalarQuantization(
+    scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+)
+QUANTIZED_SEARCH_PARAMS = models.SearchParams(
+    quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+
+# The system message is identical across a user's questions (instructions + enrolled
+# courses), so it goes first and the provider can reuse its cached prefix. Anything
+# that changes per question lives in the human message after it. Both prompts are
+# static, so they are parsed once here rather than on every answer().
+_HUMAN_TEMPLATE = "Use this context to answer:\n{context}\n\nQuestion: {question}"
+CHILD_FRIENDLY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "You're a friendly teacher talking to a six-year-old. "
+     "Explain things in a super simple way, like you're telling a story with toys, animals, "
+     "or fun games a six-year-old would love.\n\n{enrolled_context}"),
+    ("human", _HUMAN_TEMPLATE)
+])
+DEFAULT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "You're an educational assistant. "
+     "Provide detailed responses incorporating user-uploaded materials and course information."
+     "\n\n{enrolled_context}"),
+    ("human", _HUMAN_TEMPLATE)
+])
+
 class RAGPipeline:
     def __init__(self, supabase_client=None):
         try:
@@ -30,24 +69,39 @@ class RAGPipeline:
                 temperature=0.3,
                 google_api_key=os.getenv("GOOGLE_API_KEY")
             )
-            if supabase_client:
-                self.supabase = supabase_client
-            else:
-                self.supabase = create_client(
-                    os.getenv("SUPABASE_URL"),
-                    os.getenv("SUPABASE_KEY")
-                )
-            self.embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+            self.supabase = supabase_client or get_supabase()
+            self.embedder = self._load_embedder()
             self.loaders = {
                 ".pdf": PyPDFLoader,
                 ".txt": TextLoader
             }
+            self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+            self._retrieval_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-retrieval")
             print("✅ Components initialized successfully")
         except Exception as e:
             print(f"❌ Initialization failed: {str(e)}")
             raise
 
+    @staticmethod
+    def _load_embedder() -> HuggingFaceEmbeddings:
+        # int8 ONNX export of MiniLM (shipped in the model repo) runs 2-4x faster on CPU than
+        # the float32 PyTorch model, with the same 384-dim output. Needs optimum[onnxruntime];
+        # without it, fall back to PyTorch.
+        try:
+            embedder = HuggingFaceEmbeddings(
+                model_name=EMBEDDING_MODEL,
+                model_kwargs={"backend": "onnx", "model_kwargs": {"file_name": ONNX_EMBEDDING_FILE}}
+            )
+            print(f"✅ Using ONNX embedder ({ONNX_EMBEDDING_FILE})")
+            return embedder
+        except Exception as e:
+            print(f"⚠️ ONNX embedder unavailable, using PyTorch: {str(e)}")
+            return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
     def setup_agents(self):
+        # Agents and the crew hold LLM handles; build them once per pipeline
+        if getattr(self, "_crew_ready", False):
+            return
         try:
             self.intent_agent = Agent(
                 role="Intent Classifier",
@@ -82,55 +136,87 @@ class RAGPipeline:
                 tasks=[classify_task, review_task],
                 verbose=False
             )
+            self._crew_ready = True
             print("✅ Agents setup complete")
         except Exception as e:
             print(f"❌ Agent setup failed: {str(e)}")
             raise
 
-    def add_documents(self, documents: List, user_id: str) -> bool:
+    def add_documents(self, documents: Iterable, user_id: str) -> bool:
+        """Split, embed and store documents in batches of EMBED_BATCH_SIZE chunks.
+
+        `documents` may be a lazy iterator (e.g. loader.lazy_load()), so a large file is
+        never fully held in memory.
+        """
         try:
             if not self.qdrant.collection_exists(collection_name="user_documents"):
                 self.qdrant.create_collection(
                     collection_name="user_documents",
-                    vectors_config={"size": 384, "distance": "Cosine"}
+                    vectors_config={"size": 384, "distance": "Cosine"},
+                    hnsw_config=models.HnswConfigDiff(m=16, ef_construct=128),
+                    quantization_config=QUANTIZATION_CONFIG
                 )
             
-            embeddings = self.embedder.embed_documents([doc.page_content for doc in documents])
-            
-            points = [
-                {
-                    "id": f"{user_id}_{i}_{int(datetime.now().timestamp())}",
-                    "vector": embedding,
-                    "payload": {
-                        "content": doc.page_content,
-                        "user_id": user_id,
-                        "source": doc.metadata.get("source", "uploaded_file"),
-                        "uploaded_at": datetime.now().isoformat()
-                    }
-                }
-                for i, (doc, embedding) in enumerate(zip(documents, embeddings))
-            ]
+            uploaded_at = datetime.now()
+            batch = []
+            total = 0
+            for doc in documents:
+                for chunk in self.text_splitter.split_documents([doc]):
+                    batch.append(chunk)
+                    if len(batch) == EMBED_BATCH_SIZE:
+                        self._upsert_chunks(batch, user_id, total, uploaded_at)
+                        total += len(batch)
+                        batch = []
+            if batch:
+                self._upsert_chunks(batch, user_id, total, uploaded_at)
+                total += len(batch)
             
-            self.qdrant.upsert(
-                collection_name="user_documents",
-                points=points
-            )
-            print(f"✅ Added {len(documents)} documents for user {user_id}")
+            print(f"✅ Added {total} chunks for user {user_id}")
             return True
             
         except Exception as e:
             print(f"❌ Error adding documents: {str(e)}")
             return False
 
+    def _upsert_chunks(self, chunks: List, user_id: str, offset: int, uploaded_at: datetime):
+        # One embedding call and one Qdrant request per batch
+        embeddings = self.embedder.embed_documents([chunk.page_content for chunk in chunks])
+        points = [
+            models.PointStruct(
+                id=self._point_id(user_id, offset + i, uploaded_at),
+                vector=embedding,
+                payload={
+                    "content": chunk.page_content,
+                    "user_id": user_id,
+                    "source": chunk.metadata.get("source", "uploaded_file"),
+                    "uploaded_at": uploaded_at.isoformat()
+                }
+            )
+            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+        ]
+        # wait=False: don't block ingestion on Qdrant applying each batch
+        self.qdrant.upsert(
+            collection_name="user_documents",
+            points=points,
+            wait=False
+        )
+
+    @staticmethod
+    def _point_id(user_id: str, index: int, uploaded_at: datetime) -> int:
+        # Qdrant ids must be unsigned ints or UUIDs; hash the old "{user}_{i}_{ts}" id down to 64 bits
+        key = f"{user_id}_{index}_{int(uploaded_at.timestamp())}".encode()
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
     def fetch_courses(self, query: str = None, limit: int = 5) -> List[dict]:
         try:
             select_query = self.supabase.table("courses").select("*")
             
             if query:
-                query_lower = query.lower()
-                select_query = select_query.ilike("title", f"%{query_lower}%")\
-                    .or_(f"subject.ilike.%{query_lower}%")\
-                    .or_(f"description.ilike.%{query_lower}%")
+                # Commas and parentheses are or_() syntax, so they can't appear in the term
+                term = query.lower().translate(str.maketrans(",()", "   ")).strip()
+                select_query = select_query.or_(
+                    f"title.ilike.%{term}%,subject.ilike.%{term}%,description.ilike.%{term}%"
+                )
             
             response = select_query.limit(limit).execute()
             
@@ -144,78 +230,72 @@ class RAGPipeline:
             print(f"❌ Error fetching courses: {str(e)}")
             return []
 
-    def basic_rag_chain(self, query: str, user_id: str = "unknown") -> str:
+    def search_user_documents(self, question: str, user_id: str = "unknown") -> List:
+        if user_id == "unknown":
+            return []
+        print("🔎 Searching Qdrant for user documents...")
         try:
-            print(f"🔍 Processing query: {query}")
-            parts = query.split("\n\nQuestion: ")
-            context_part = parts[0] if len(parts) > 1 else ""
-            question = parts[-1]
-            print(f"📝 Question: {question}")
-            print(f"📝 Context part: {context_part}")
-            print(f"👤 User ID: {user_id}")
-            
-            user_doc_results = []
-            if user_id != "unknown":
-                print("🔎 Searching Qdrant for user documents...")
-                try:
-                    user_doc_results = self.qdrant.search(
-                        collection_name="user_documents",
-                        query_vector=self.embedder.embed_query(question),
-                        limit=3,
-                        query_filter={"must": [{"key": "user_id", "match": {"value": user_id}}]}
-                    )
-                    print(f"📚 Found {len(user_doc_results)} user documents")
-                except Exception as e:
-                    print(f"❌ Qdrant search failed: {str(e)}")
-            
-            print("🔎 Fetching relevant courses from Supabase...")
-            course_results = self.fetch_courses(query=question, limit=5)
-            
-            user_doc_context = "\n\n".join([f"User Document: {hit.payload['content'][:200]}..." for hit in user_doc_results]) if user_doc_results else "No relevant user documents found."
-            course_context = "\n\n".join([
-                f"Course: {course['title']}\n"
-                f"Subject: {course['subject']}\n"
-                f"Level: {course['level']}\n"
-                f"Description: {course.get('description', 'N/A')}\n"
-                f"Price: ${course['price']}\n"
-                f"Subscribers: {course['subscribers']:,}"
-                for course in course_results
-            ]) if course_results else "No relevant courses found."
-            
-            full_context = f"{context_part}\n\nUser Uploaded Documents:\n{user_doc_context}\n\nAvailable Courses:\n{course_context}"
-            print(f"📑 Full context prepared:\n{full_context[:500]}...")
-            
-            is_child_friendly = "six-year-old" in question.lower() or "child" in question.lower()
-            
-            print("📝 Building prompt...")
-            if is_child_friendly:
-                prompt = ChatPromptTemplate.from_template("""
-                You're a friendly teacher talking to a six-year-old. Use this context to answer:
-                {context}
-                
-                Question: {question}
-                Explain it in a super simple way, like you're telling a story with toys, animals, or fun games a six-year-old would love:""")
-            else:
-                prompt = ChatPromptTemplate.from_template("""
-                You're an educational assistant. Use this context to answer:
-                {context}
-                
-                Question: {question}
-                Provide a detailed response incorporating user-uploaded materials and course information:""")
-            
-            print("🔗 Creating chain...")
-            chain = (
-                {"context": RunnablePassthrough(), "question": RunnablePassthrough()}
-                | prompt
-                | self.llm
-                | StrOutputParser()
-            )
-            
-            print("🤖 Invoking chain...")
-            response = chain.invoke({"context": full_context, "question": question})
-            print(f"✅ Generated response: {response[:200]}...")
-            return response
-            
+            results = self.qdrant.query_points(
+                collection_name="user_documents",
+                query=self.embedder.embed_query(question),
+                limit=3,
+                query_filter={"must": [{"key": "user_id", "match": {"value": user_id}}]},
+                search_params=QUANTIZED_SEARCH_PARAMS
+            ).points
+            print(f"📚 Found {len(results)} user documents")
+            return results
+        except Exception as e:
+            print(f"❌ Qdrant search failed: {str(e)}")
+            return []
+
+    def answer(self, question: str, user_id: str = "unknown", enrolled_context: str = "") -> str:
+        """Like basic_rag_chain, but raises on failure instead of returning an error message."""
+        print(f"🔍 Processing query: {question}")
+        context_part = f"User's enrolled courses:\n{enrolled_context.strip()}" if enrolled_context else ""
+        print(f"📝 Context part: {context_part}")
+        print(f"👤 User ID: {user_id}")
+        
+        # The Qdrant search (embedding + query) and the Supabase course lookup are
+        # independent; run them side by side so the wait is the slower of the two
+        user_docs_future = self._retrieval_pool.submit(self.search_user_documents, question, user_id)
+        print("🔎 Fetching relevant courses from Supabase...")
+        course_results = self.fetch_courses(query=question, limit=5)
+        user_doc_results = user_docs_future.result()
+        
+        user_doc_context = "\n\n".join([f"User Document: {hit.payload['content'][:200]}..." for hit in user_doc_results]) if user_doc_results else "No relevant user documents found."
+        course_context = "\n\n".join([
+            f"Course: {course['title']}\n"
+            f"Subject: {course['subject']}\n"
+            f"Level: {course['level']}\n"
+            f"Description: {course.get('description', 'N/A')}\n"
+            f"Price: ${course['price']}\n"
+            f"Subscribers: {course['subscribers']:,}"
+            for course in course_results
+        ]) if course_results else "No relevant courses found."
+        
+        retrieved_context = f"User Uploaded Documents:\n{user_doc_context}\n\nAvailable Courses:\n{course_context}"
+        print(f"📑 Retrieved context prepared:\n{retrieved_context[:500]}...")
+        
+        is_child_friendly = "six-year-old" in question.lower() or "child" in question.lower()
+        
+        print("📝 Building prompt...")
+        prompt = CHILD_FRIENDLY_PROMPT if is_child_friendly else DEFAULT_PROMPT
+        
+        print("🔗 Creating chain...")
+        chain = prompt | self.llm | StrOutputParser()
+        
+        print("🤖 Invoking chain...")
+        response = chain.invoke({
+            "enrolled_context": context_part,
+            "context": retrieved_context,
+            "question": question
+        })
+        print(f"✅ Generated response: {response[:200]}...")
+        return response
+
+    def basic_rag_chain(self, question: str, user_id: str = "unknown", enrolled_context: str = "") -> str:
+        try:
+            return self.answer(question, user_id=user_id, enrolled_context=enrolled_context)
         except Exception as e:
             print(f"❌ RAG error: {str(e)}")
             return f"I couldn't process that request. Please try again. (Error: {str(e)})"
@@ -0,0 +1,256 @@
+-- schema.sql
+-- Server-side objects used by app.py. Run in the Supabase SQL editor.
+
+-- ----------------------------
+-- Admin cascades
+-- ----------------------------
+-- Each delete runs as a single transaction and a single round-trip from the app.
+-- SECURITY DEFINER is needed to touch auth.users, so the caller's role is checked here.
+
+CREATE OR REPLACE FUNCTION public.delete_user_cascade(uid uuid)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM public.users WHERE id = auth.uid() AND role = 'admin') THEN
+        RAISE EXCEPTION 'Only admins can delete users';
+    END IF;
+    DELETE FROM public.user_courses WHERE user_id = uid;
+    DELETE FROM public.users WHERE id = uid;
+    DELETE FROM auth.users WHERE id = uid;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.delete_course_cascade(cid int)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM public.users WHERE id = auth.uid() AND role = 'admin') THEN
+        RAISE EXCEPTION 'Only admins can delete courses';
+    END IF;
+    DELETE FROM public.user_courses WHERE course_id = cid;
+    DELETE FROM public.courses WHERE course_id = cid;
+END;
+$$;
+
+-- ----------------------------
+-- Timestamps and defaults
+-- ----------------------------
+-- Timestamps are set by the database, not sent from the client. Profile inserts omit
+-- role unless an admin picks one.
+
+ALTER TABLE public.users ALTER COLUMN role SET DEFAULT 'user';
+ALTER TABLE public.users ALTER COLUMN created_at TYPE timestamptz;
+ALTER TABLE public.users ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE public.users ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE public.users ALTER COLUMN last_login TYPE timestamptz;
+ALTER TABLE public.courses ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE public.feedback ALTER COLUMN created_at SET DEFAULT now();
+
+-- Tables used only by auth_data_manager.py; skipped when they don't exist.
+DO $$
+BEGIN
+    IF to_regclass('public.learning_progress') IS NOT NULL THEN
+        ALTER TABLE public.learning_progress ALTER COLUMN last_accessed SET DEFAULT now();
+    END IF;
+    IF to_regclass('public.chat_interactions') IS NOT NULL THEN
+        ALTER TABLE public.chat_interactions ALTER COLUMN "timestamp" SET DEFAULT now();
+    END IF;
+END;
+$$;
+
+-- save_learning_progress upserts; a default only covers the insert, so refresh
+-- last_accessed on update too.
+CREATE OR REPLACE FUNCTION public.touch_last_accessed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.last_accessed := now();
+    RETURN NEW;
+END;
+$$;
+
+DO $$
+BEGIN
+    IF to_regclass('public.learning_progress') IS NOT NULL THEN
+        DROP TRIGGER IF EXISTS learning_progress_touch_last_accessed ON public.learning_progress;
+        CREATE TRIGGER learning_progress_touch_last_accessed
+            BEFORE UPDATE ON public.learning_progress
+            FOR EACH ROW EXECUTE FUNCTION public.touch_last_accessed();
+    END IF;
+END;
+$$;
+
+-- Called on sign-in (app.py, auth_api.py, auth_data_manager.py): stamps last_login and
+-- returns the profile row (empty if none yet).
+CREATE OR REPLACE FUNCTION public.touch_last_login(uid uuid)
+RETURNS SETOF public.users
+LANGUAGE sql
+AS $$
+    UPDATE public.users SET last_login = now() WHERE id = uid RETURNING *;
+$$;
+
+-- ----------------------------
+-- users
+-- ----------------------------
+-- Sign-up only creates the auth user; this trigger adds the public.users profile in
+-- the same transaction, so there is no second request and no auth user without a profile.
+
+CREATE OR REPLACE FUNCTION public.handle_new_user()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO public.users (id, email, full_name)
+    VALUES (
+        NEW.id,
+        NEW.email,
+        COALESCE(NEW.raw_user_meta_data->>'full_name', split_part(NEW.email, '@', 1))
+    )
+    ON CONFLICT (id) DO NOTHING;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS on_auth_user_created ON auth.users;
+CREATE TRIGGER on_auth_user_created
+    AFTER INSERT ON auth.users
+    FOR EACH ROW EXECUTE FUNCTION public.handle_new_user();
+
+-- Backfill profiles for auth users created before the trigger, so public.users covers every
+-- auth user and an email lookup there (fastapi.py add_user) is a complete duplicate check.
+INSERT INTO public.users (id, email, full_name)
+SELECT id, email, COALESCE(raw_user_meta_data->>'full_name', split_part(email, '@', 1))
+FROM auth.users
+ON CONFLICT (id) DO NOTHING;
+
+-- Exact email lookups (fastapi.py add_user) use a plain b-tree; the trigram index can't
+-- serve equality as cheaply.
+CREATE INDEX IF NOT EXISTS users_email_idx ON public.users (email);
+
+-- The admin panel searches users with email ILIKE '%...%'; a trigram index keeps that
+-- off a sequential scan.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS users_email_trgm ON public.users USING gin (email gin_trgm_ops);
+
+-- ----------------------------
+-- courses
+-- ----------------------------
+-- rag_pipeline.fetch_courses matches title, subject or description with ILIKE '%...%'.
+-- One trigram index per column lets Postgres answer the OR with a BitmapOr of index scans.
+
+CREATE INDEX IF NOT EXISTS courses_title_trgm ON public.courses USING gin (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS courses_subject_trgm ON public.courses USING gin (subject gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS courses_description_trgm ON public.courses USING gin (description gin_trgm_ops);
+
+-- Distinct subjects and levels for the course filter dropdowns (app.py). A plain column
+-- select is capped at PostgREST's max-rows, so the catalog would be cut off. Values are
+-- returned as stored: get_all_courses filters with an exact match on the chosen one.
+
+CREATE OR REPLACE FUNCTION public.list_course_subjects()
+RETURNS TABLE (subject text)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT DISTINCT c.subject
+    FROM public.courses c
+    WHERE btrim(c.subject) <> ''
+    ORDER BY 1;
+$$;
+
+CREATE OR REPLACE FUNCTION public.list_course_levels()
+RETURNS TABLE (level text)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT DISTINCT c.level
+    FROM public.courses c
+    WHERE btrim(c.level) <> ''
+    ORDER BY 1;
+$$;
+
+-- ----------------------------
+-- user_courses
+-- ----------------------------
+-- handle_enroll_course inserts directly and treats a unique violation as "already enrolled".
+-- Existing duplicate enrollments are removed first (keeping the furthest progress), or the
+-- constraint can't be added; the block is skipped once the constraint exists.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'user_courses_user_id_course_id_key'
+    ) THEN
+        DELETE FROM public.user_courses d
+        USING (
+            SELECT ctid, row_number() OVER (
+                PARTITION BY user_id, course_id ORDER BY progress DESC NULLS LAST, ctid
+            ) AS rn
+            FROM public.user_courses
+        ) ranked
+        WHERE d.ctid = ranked.ctid AND ranked.rn > 1;
+
+        ALTER TABLE public.user_courses
+            ADD CONSTRAINT user_courses_user_id_course_id_key UNIQUE (user_id, course_id);
+    END IF;
+END;
+$$;
+
+-- ----------------------------
+-- Dashboard
+-- ----------------------------
+-- Everything show_dashboard needs in one round-trip. "enrolled" has the same shape as
+-- get_user_courses() in app.py: [{progress, courses: {...}}]; "avg_progress" is
+-- aggregated here so the app does no arithmetic per rerun.
+
+CREATE OR REPLACE FUNCTION public.get_dashboard_bundle(uid uuid)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'role', (SELECT role FROM public.users WHERE id = uid),
+        'enrolled', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'progress', uc.progress,
+                'courses', jsonb_build_object(
+                    'course_id', c.course_id,
+                    'title', c.title,
+                    'subject', c.subject,
+                    'level', c.level,
+                    'duration', c.duration,
+                    'description', c.description,
+                    'subscribers', c.subscribers,
+                    'url', c.url
+                )
+            ) ORDER BY c.course_id)
+            FROM public.user_courses uc
+            JOIN public.courses c USING (course_id)
+            WHERE uc.user_id = uid
+        ), '[]'::jsonb),
+        'avg_progress', (
+            SELECT COALESCE(avg(uc.progress), 0)
+            FROM public.user_courses uc
+            JOIN public.courses c USING (course_id)
+            WHERE uc.user_id = uid
+        ),
+        'recent', COALESCE((
+            SELECT jsonb_agg(r)
+            FROM (
+                SELECT course_id, title, subject, level
+                FROM public.courses
+                ORDER BY created_at DESC NULLS LAST
+                LIMIT 5
+            ) r
+        ), '[]'::jsonb)
+    );
+$$;
@@ -4,7 +4,7 @@
 # venv\Scripts\activate
 # deactivate
 
-# pip install pandas nltk scikit-learn sentence-transformers qdrant-client spacy
+# pip install pandas numpy nltk scikit-learn sentence-transformers qdrant-client spacy
 # python -m spacy download en_core_web_sm
 
 # data_path = r"data\udemy_course_data.csv"
@@ -12,14 +12,18 @@
 # python udemy_data_to_vector_db.py
 
 import pandas as pd
+import numpy as np
 import re
+from itertools import islice
+from functools import lru_cache
 from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient, models
 import spacy
+import multiprocessing
+import os
 import time
 from tqdm import tqdm
 
@@ -29,9 +33,18 @@ from tqdm import tqdm
 print("\n🚀 Initializing components...")
 start_time = time.time()
 
-# NLP tools
-nlp = spacy.load("en_core_web_sm")
+# NLP tools (spaCy is only used for NER, so the other components aren't loaded)
+nlp = spacy.load("en_core_web_sm", exclude=["tagger", "parser", "attribute_ruler", "lemmatizer"])
 lemmatizer = WordNetLemmatizer()
+model = SentenceTransformer("all-MiniLM-L6-v2")
+
+# Rows per batch in the enrichment pass
+BATCH_SIZE = 256
+# Rows per chunk when assigning LDA topics
+LDA_CHUNK_SIZE = 4096
+# Qdrant server to load into (e.g. http://localhost:6333); without it an in-memory
+# instance is used
+QDRANT_URL = os.getenv("QDRANT_URL")
 
 # ----------------------------
 # 1. Data Loading & Cleaning
@@ -60,85 +73,113 @@ except Exception as e:
 # ----------------------------
 print("\n📝 Step 2/5: Normalizing text...")
 
+_PUNCT = re.compile(r"[^a-z0-9\s]")
+
+# Titles share a small vocabulary, so each distinct token is lemmatized once
+@lru_cache(maxsize=None)
+def lemmatize(token):
+    return lemmatizer.lemmatize(token)
+
 def normalize_text(text):
-    text = str(text).lower()
-    text = re.sub(r"[^a-z0-9\s]", "", text)
-    tokens = word_tokenize(text)
-    lemmas = [lemmatizer.lemmatize(token) for token in tokens]
-    return " ".join(lemmas)
+    text = _PUNCT.sub("", str(text).lower())
+    return " ".join(lemmatize(token) for token in text.split())
 
-df["processed_text"] = df["course_title"].apply(normalize_text)
+# Same steps as normalize_text, with lowercasing, stripping and splitting done column-wise.
+# Punctuation is already gone, so a whitespace split gives the tokens word_tokenize did.
+title_tokens = df["course_title"].astype(str).str.lower().str.replace(_PUNCT, "", regex=True).str.split()
+df["processed_text"] = [" ".join(lemmatize(token) for token in tokens) for tokens in title_tokens]
 
 # ----------------------------
-# 3. Data Enrichment
+# 3-4. Enrichment & Vectorization
 # ----------------------------
-print("\n✨ Step 3/5: Enriching data...")
-
-# Topic Modeling
-print(" - Running topic modeling (LDA)...")
-tfidf = TfidfVectorizer(max_features=1000)
-X_tfidf = tfidf.fit_transform(df["processed_text"])
-lda = LatentDirichletAllocation(n_components=5, random_state=42)
-df["topic"] = lda.fit_transform(X_tfidf).argmax(axis=1)
+# One pass over the rows in batches: each batch is run through NER, hashed into term
+# counts that update the LDA model, and embedded, instead of walking the whole dataset
+# once per step.
+print("\n✨ Step 3-4/5: Enriching data and generating embeddings...")
+
+# Term counts for LDA; hashing needs no fitted vocabulary, so it works batch by batch
+hasher = HashingVectorizer(n_features=2**15, alternate_sign=False, norm=None)
+# Online LDA, trained one batch at a time so no full document-term matrix is built
+lda = LatentDirichletAllocation(n_components=5, learning_method="online", total_samples=len(df), random_state=42)
+
+titles = df["course_title"].astype(str).tolist()
+texts = df["processed_text"].tolist()
+# Extra NER worker processes only where they're forked: under spawn (Windows, macOS) each
+# worker would re-run this whole script on import
+ner_processes = -1 if multiprocessing.get_start_method() == "fork" else 1
+ner_docs = nlp.pipe(titles, batch_size=BATCH_SIZE, n_process=ner_processes)
+
+entities, embedding_batches = [], []
+for start in tqdm(range(0, len(df), BATCH_SIZE), desc="Processing batches"):
+    batch_texts = texts[start:start + BATCH_SIZE]
+    entities.extend([ent.text for ent in doc.ents] for doc in islice(ner_docs, len(batch_texts)))
+    lda.partial_fit(hasher.transform(batch_texts))
+    # float16 halves the matrix held until upload; unit-length vectors lose nothing that
+    # matters for cosine ranking, and the collection searches int8 copies anyway
+    embedding_batches.append(
+        model.encode(batch_texts, convert_to_numpy=True, normalize_embeddings=True).astype(np.float16)
+    )
 
-# Named Entity Recognition
-print(" - Extracting named entities...")
-def extract_entities(text):
-    try:
-        return [ent.text for ent in nlp(text).ents]
-    except:
-        return []
+df["entities"] = entities
+embeddings = np.vstack(embedding_batches)
 
-df["entities"] = [extract_entities(title) for title in tqdm(df["course_title"], desc="Processing NER")]
+# Topic Modeling: assign topics with the trained model, re-hashing chunk by chunk
+print(" - Assigning topics (LDA)...")
+df["topic"] = np.concatenate([
+    lda.transform(hasher.transform(texts[start:start + LDA_CHUNK_SIZE])).argmax(axis=1)
+    for start in range(0, len(texts), LDA_CHUNK_SIZE)
+])
 
-# ----------------------------
-# 4. Vectorization
-# ----------------------------
-print("\n🧮 Step 4/5: Generating embeddings...")
-model = SentenceTransformer("all-MiniLM-L6-v2")
-embeddings = model.encode(df["processed_text"].tolist(), show_progress_bar=True)
+# Positional ids for Qdrant, matching the rows of `embeddings`
+df = df.reset_index(drop=True)
 
 # ----------------------------
 # 5. Vector Database Integration
 # ----------------------------
 print("\n💾 Step 5/5: Storing in Qdrant...")
 try:
-    client = QdrantClient(":memory:")  # For production: QdrantClient(url="http://localhost:6333")
+    # gRPC (port 6334) carries the vectors as protobuf rather than JSON
+    client = QdrantClient(url=QDRANT_URL, prefer_grpc=True) if QDRANT_URL else QdrantClient(":memory:")
     
-    # Create collection
-    client.recreate_collection(
+    # Create collection (recreate_collection is gone from current qdrant-client)
+    if client.collection_exists("udemy_courses"):
+        client.delete_collection("udemy_courses")
+    client.create_collection(
         collection_name="udemy_courses",
         vectors_config=models.VectorParams(
             size=384,
             distance=models.Distance.COSINE
+        ),
+        hnsw_config=models.HnswConfigDiff(m=16, ef_construct=128),
+        # int8 copies of the vectors kept in RAM: 4x less memory to scan per search
+        quantization_config=models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                always_ram=True
+            )
         )
     )
 
-    # Upload in batches
-    batch_size = 100
-    for i in tqdm(range(0, len(df), batch_size), desc="Uploading courses"):
-        batch = df.iloc[i:i+batch_size]
-        points = [
-            models.PointStruct(
-                id=idx,
-                vector=embeddings[idx].tolist(),
-                payload={
-                    "title": row["course_title"],
-                    "subject": row["subject"],
-                    "level": row["level"],
-                    "price": float(row["price"]),
-                    "topic": int(row["topic"]),
-                    "entities": row["entities"],
-                    "duration": row["content_duration"],
-                    "subscribers": int(row["num_subscribers"])
-                }
-            )
-            for idx, row in batch.iterrows()
-        ]
-        client.upsert(
-            collection_name="udemy_courses",
-            points=points
-        )
+    # Upload in batches; ids are the positional row numbers. Kept to one worker: the
+    # client's extra workers are spawned (forkserver/spawn) and would re-run this script.
+    payload = pd.DataFrame({
+        "title": df["course_title"],
+        "subject": df["subject"],
+        "level": df["level"],
+        "price": df["price"].astype(float),
+        "topic": df["topic"].astype(int),
+        "entities": df["entities"],
+        "duration": df["content_duration"],
+        "subscribers": df["num_subscribers"].astype(int)
+    }).to_dict("records")
+    client.upload_collection(
+        collection_name="udemy_courses",
+        vectors=embeddings,
+        payload=payload,
+        ids=list(range(len(df))),
+        batch_size=BATCH_SIZE,
+        parallel=1
+    )
 
 except Exception as e:
     print(f"❌ Qdrant Error: {str(e)}")
@@ -158,13 +199,17 @@ for query in test_queries:
     query_embedding = model.encode([normalize_text(query)])
     
     # Using the current recommended API
-    results = client.search(
+    results = client.query_points(
         collection_name="udemy_courses",
-        query_vector=query_embedding[0].tolist(),
+        query=query_embedding[0].tolist(),
         limit=3,
         with_payload=True,
-        with_vectors=False
-    )
+        with_vectors=False,
+        # Search the int8 vectors, then rescore the top 2x candidates with the originals
+        search_params=models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+        )
+    ).points
     
     print(f"\n🔍 Results for '{query}':")
     for i, hit in enumerate(results, 1):